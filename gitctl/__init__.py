@@ -1,6 +1,9 @@
+import os
 import sys
 import logging
 import gitctl.parser
+import gitctl.tracing
+import gitctl.utils
 
 class LevelFilter(logging.Filter):
     def __init__(self, level):
@@ -15,6 +18,19 @@ def make_handler(outstream, format, level):
     handler.addFilter(LevelFilter(level))
     return handler
 
+def exit_status(result):
+    """Returns the exit status of the gitctl script for the ``result`` of a
+    command. An integer that fits in an exit status is used as is, e.g. the
+    status of ``gitctl grep``, and other integers, e.g. the sum of the
+    statuses of ``gitctl sh``, mean failure. Anything else, e.g. the paths
+    ``gitctl path`` returns, means success.
+    """
+    if not isinstance(result, (int, long)):
+        return 0
+    if 0 <= result <= 255:
+        return result
+    return 1
+
 def main():
     """Runs the gitctl functionality."""
     # Set up the logger
@@ -23,11 +39,32 @@ def main():
     logging.getLogger('gitctl').addHandler(make_handler(sys.stdout, '%(message)s', logging.INFO))
     # Error messages to stderr
     logging.getLogger('gitctl').addHandler(make_handler(sys.stderr, '%(levelname)s %(message)s', logging.WARN))
+    logging.getLogger('gitctl').addHandler(make_handler(sys.stderr, '%(levelname)s %(message)s', logging.ERROR))
     logging.getLogger('gitctl').addHandler(make_handler(sys.stderr, '%(levelname)s %(message)s', logging.CRITICAL))
     logging.getLogger('gitctl').addHandler(make_handler(sys.stderr, '%(levelname)s %(message)s', logging.DEBUG))
 
     args = gitctl.parser.parser.parse_args()
-    args.func(args)
+    if getattr(args, 'read_only', False):
+        # Keep git from taking locks it does not need, e.g. the index lock
+        # ``git status`` takes to refresh the index, so that reading does not
+        # get in the way of other processes changing the projects.
+        os.environ['GIT_OPTIONAL_LOCKS'] = '0'
+    try:
+        if args.profile is None:
+            return exit_status(args.func(args))
+
+        tracer = gitctl.tracing.Tracer()
+        gitctl.tracing.install(tracer)
+        try:
+            with gitctl.tracing.phase(args.func.__name__.replace('_', ' ')):
+                return exit_status(args.func(args))
+        finally:
+            gitctl.tracing.uninstall()
+            tracer.write(args.profile)
+            print >> sys.stderr, tracer.summary(args.profile_top)
+    except gitctl.utils.CommandTimeout, x:
+        logging.getLogger('gitctl').critical('%s', x)
+        return 1
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""Synthetic workspace benchmarks.
+
+Generates a workspace of externals backed by local bare upstream repositories
+and times the gitctl commands against it end to end. The results are saved as
+JSON so that a run can be compared against an earlier baseline.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+COMMANDS = ('update', 'fetch', 'status', 'pending', 'branch', 'sh')
+
+# Arguments used for each of the timed commands.
+COMMAND_ARGS = {
+    'update' : ['update'],
+    'fetch' : ['fetch'],
+    'status' : ['status'],
+    'pending' : ['pending'],
+    'branch' : ['branch', '--list'],
+    'sh' : ['sh', '-c', 'true'],
+    }
+
+def git(path, *args, **kwargs):
+    """Runs git in ``path`` and returns its stdout. Raises RuntimeError if git
+    exits with a non-zero status.
+    """
+    pipe = subprocess.Popen(('git',) + args, cwd=path,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = pipe.communicate(kwargs.get('input'))
+    if pipe.returncode != 0:
+        raise RuntimeError('git %s failed in %s: %s' % (' '.join(args), path, stderr.strip()))
+    return stdout.strip()
+
+class FastImport(object):
+    """Builds a ``git fast-import`` stream of synthetic commits."""
+
+    def __init__(self, timestamp=1234567890):
+        self.parts = []
+        self.mark = 0
+        self.timestamp = timestamp
+
+    def commit(self, ref, message, files, parent=None):
+        """Adds a commit on ``ref`` and returns its mark. ``files`` is a
+        mapping of paths to file contents.
+        """
+        self.mark += 1
+        self.timestamp += 60
+        self.parts.append('commit %s\nmark :%d\n' % (ref, self.mark))
+        self.parts.append('committer gitctl-bench <bench@localhost> %d +0000\n' % self.timestamp)
+        self.parts.append('data %d\n%s\n' % (len(message), message))
+        if parent is not None:
+            self.parts.append('from %s\n' % parent)
+        for path, content in sorted(files.items()):
+            self.parts.append('M 644 inline %s\ndata %d\n%s\n' % (path, len(content), content))
+        self.parts.append('\n')
+        return ':%d' % self.mark
+
+    def reset(self, ref, parent):
+        """Points ``ref`` to ``parent``."""
+        self.parts.append('reset %s\nfrom %s\n\n' % (ref, parent))
+
+    def run(self, path):
+        """Feeds the stream to ``git fast-import`` in the repository at ``path``."""
+        git(path, 'fast-import', '--quiet', input=''.join(self.parts))
+
+def create_upstream(path, commits=10, branches=0):
+    """Creates a bare upstream repository at ``path``.
+
+    The development branch will contain ``commits`` commits with the staging
+    and production branches trailing behind it. Each of the ``branches``
+    feature branches has a single commit on top of development.
+    """
+    os.makedirs(path)
+    git(path, 'init', '--bare', '--quiet')
+
+    stream = FastImport()
+    marks = []
+    for i in range(max(commits, 1)):
+        marks.append(stream.commit('refs/heads/development', 'Commit %d' % i, {
+            'README.txt' : 'Revision %d\n' % i,
+            'src/module_%d.txt' % (i % 20) : 'Line %d\n' % i,
+            }))
+    stream.reset('refs/heads/staging', marks[len(marks) * 2 / 3])
+    stream.reset('refs/heads/production', marks[len(marks) / 3])
+    for i in range(branches):
+        stream.commit('refs/heads/feature-%d' % i, 'Feature %d' % i, {
+            'feature_%d.txt' % i : 'Feature %d\n' % i}, parent=marks[-1])
+    stream.run(path)
+    git(path, 'symbolic-ref', 'HEAD', 'refs/heads/development')
+
+def advance_upstream(path, message):
+    """Adds a new commit on top of the development branch of the bare
+    repository at ``path``.
+    """
+    stream = FastImport(timestamp=int(time.time()))
+    stream.commit('refs/heads/development', message,
+                  {'upstream.txt' : '%s\n' % message}, parent='refs/heads/development^0')
+    stream.run(path)
+
+def write_config(workspace, upstream_dir):
+    """Writes the gitctl.cfg for the synthetic workspace."""
+    filename = os.path.join(workspace, 'gitctl.cfg')
+    open(filename, 'w').write("""[gitctl]
+upstream = origin
+upstream-url = %s
+branches =
+    development
+    staging
+    production
+development-branch = development
+staging-branch = staging
+production-branch = production
+commit-email = bench@localhost
+commit-email-prefix = [BENCH]
+""" % upstream_dir)
+    return filename
+
+def write_externals(workspace, projects):
+    """Writes the gitexternals.cfg for the synthetic workspace."""
+    filename = os.path.join(workspace, 'gitexternals.cfg')
+    ext = open(filename, 'w')
+    for proj in projects:
+        print >> ext, '[%s]' % proj['name']
+        print >> ext, 'url = %s' % proj['url']
+        print >> ext, 'type = git'
+        print >> ext, 'container = %s' % proj['container']
+        print >> ext, 'treeish = %s' % proj['treeish']
+        print >> ext
+    ext.close()
+    return filename
+
+class Workspace(object):
+    """A synthetic gitctl workspace."""
+
+    def __init__(self, root, projects=10, branches=3, commits=20,
+                 dirty=0.1, diverged=0.1, pinned=0.5, seed=0):
+        self.root = root
+        self.parameters = {
+            'projects' : projects,
+            'branches' : branches,
+            'commits' : commits,
+            'dirty' : dirty,
+            'diverged' : diverged,
+            'pinned' : pinned,
+            'seed' : seed,
+            }
+        self.upstream_dir = os.path.join(root, 'upstream')
+        self.path = os.path.join(root, 'workspace')
+        self.config = os.path.join(self.path, 'gitctl.cfg')
+        self.externals = os.path.join(self.path, 'gitexternals.cfg')
+        self.projects = [{
+            'name' : 'project-%03d' % i,
+            'url' : os.path.join(self.upstream_dir, 'project-%03d.git' % i),
+            'container' : os.path.join(self.path, 'src'),
+            'treeish' : 'development',
+            } for i in range(projects)]
+
+    def project_path(self, proj):
+        return os.path.join(proj['container'], proj['name'])
+
+    def generate(self):
+        """Creates the upstream repositories and the workspace configuration."""
+        os.makedirs(self.path)
+        for proj in self.projects:
+            create_upstream(proj['url'], self.parameters['commits'], self.parameters['branches'])
+        write_config(self.path, self.upstream_dir)
+        write_externals(self.path, self.projects)
+
+    def sample(self, fraction, offset=0):
+        """Returns a reproducible sample of the projects."""
+        count = int(round(len(self.projects) * fraction))
+        projects = list(self.projects)
+        random.Random(self.parameters['seed'] + offset).shuffle(projects)
+        return projects[:count]
+
+    def mutate(self):
+        """Introduces pinned, diverged and dirty projects into a workspace
+        that has already been cloned.
+        """
+        for proj in self.sample(self.parameters['pinned'], 1):
+            proj['treeish'] = git(self.project_path(proj), 'rev-parse', 'origin/production')
+        write_externals(self.path, self.projects)
+
+        for proj in self.sample(self.parameters['diverged'], 2):
+            path = self.project_path(proj)
+            git(path, 'checkout', '--quiet', 'development')
+            open(os.path.join(path, 'local.txt'), 'w').write('Local change\n')
+            git(path, 'add', 'local.txt')
+            git(path, 'commit', '--quiet', '-m', 'Local change')
+            advance_upstream(proj['url'], 'Upstream change')
+
+        for proj in self.sample(self.parameters['dirty'], 3):
+            open(os.path.join(self.project_path(proj), 'README.txt'), 'a').write('Uncommitted\n')
+
+    def gitctl(self, *args):
+        """Runs the gitctl script in the workspace and returns a tuple of the
+        exit status and the elapsed wall time.
+        """
+        command = [sys.executable, '-c', 'import sys, gitctl; sys.exit(gitctl.main())',
+                   '--config', self.config, '--externals', self.externals] + list(args)
+        devnull = open(os.devnull, 'w')
+        start = time.time()
+        try:
+            status = subprocess.call(command, cwd=self.path, stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+        return status, time.time() - start
+
+def summarize(runs):
+    """Returns the summary statistics of a list of timings."""
+    ordered = sorted(runs)
+    return {
+        'runs' : runs,
+        'best' : ordered[0],
+        'median' : ordered[len(ordered) / 2],
+        'mean' : sum(ordered) / len(ordered),
+        }
+
+def run_benchmark(workspace, commands=COMMANDS, repeat=3):
+    """Generates the ``workspace`` and times each of the ``commands``."""
+    results = {}
+    workspace.generate()
+
+    status, elapsed = workspace.gitctl('update')
+    results['clone'] = summarize([elapsed])
+    results['clone']['status'] = [status]
+    workspace.mutate()
+
+    for name in commands:
+        timings, statuses = [], []
+        for i in range(repeat):
+            status, elapsed = workspace.gitctl(*COMMAND_ARGS[name])
+            timings.append(elapsed)
+            statuses.append(status)
+        results[name] = summarize(timings)
+        results[name]['status'] = statuses
+
+    return results
+
+def environment():
+    """Returns information about the benchmark environment."""
+    try:
+        import pkg_resources
+        version = pkg_resources.get_distribution('gitctl').version
+    except Exception:
+        version = 'unknown'
+    return {
+        'gitctl' : version,
+        'git' : git(os.getcwd(), '--version'),
+        'python' : sys.version.split()[0],
+        'platform' : sys.platform,
+        'created' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+def compare(results, baseline):
+    """Returns a textual comparison of the median timings of ``results`` and
+    ``baseline``.
+    """
+    lines = ['%-10s %10s %10s %8s' % ('command', 'baseline', 'current', 'change')]
+    for name in sorted(results['commands']):
+        current = results['commands'][name]['median']
+        if name not in baseline['commands']:
+            lines.append('%-10s %10s %10.3f %8s' % (name, '-', current, '-'))
+            continue
+        previous = baseline['commands'][name]['median']
+        change = previous and (current - previous) / previous * 100.0 or 0.0
+        lines.append('%-10s %10.3f %10.3f %+7.1f%%' % (name, previous, current, change))
+    return '\n'.join(lines)
+
+parser = argparse.ArgumentParser(
+    prog='gitctl-bench',
+    description='Times gitctl commands against a generated synthetic workspace.')
+parser.add_argument('--projects', '-n', type=int, default=10,
+    help='Number of externals in the workspace. Defaults to 10.')
+parser.add_argument('--branches', '-b', type=int, default=3,
+    help='Number of feature branches in each external in addition to the '
+         'development, staging and production branches. Defaults to 3.')
+parser.add_argument('--commits', '-k', type=int, default=20,
+    help='Number of commits in the development branch. Defaults to 20.')
+parser.add_argument('--dirty', type=float, default=0.1,
+    help='Fraction of externals with uncommitted changes. Defaults to 0.1.')
+parser.add_argument('--diverged', type=float, default=0.1,
+    help='Fraction of externals whose development branch has diverged from '
+         'upstream. Defaults to 0.1.')
+parser.add_argument('--pinned', type=float, default=0.5,
+    help='Fraction of externals pinned to a SHA1 revision. Defaults to 0.5.')
+parser.add_argument('--seed', type=int, default=0,
+    help='Seed used to select the dirty, diverged and pinned externals.')
+parser.add_argument('--repeat', '-r', type=int, default=3,
+    help='Number of times each command is timed. Defaults to 3.')
+parser.add_argument('--commands', default=','.join(COMMANDS),
+    help='Comma separated list of commands to time. Defaults to %s.' % ','.join(COMMANDS))
+parser.add_argument('--workspace',
+    help='Directory where the workspace is generated. The directory is kept '
+         'after the run. By default a temporary directory is used and removed.')
+parser.add_argument('--output', '-o',
+    help='File where the results are saved as JSON.')
+parser.add_argument('--baseline',
+    help='Results of an earlier run to compare against.')
+
+def main(argv=None):
+    """Runs the benchmark."""
+    args = parser.parse_args(argv)
+    commands = [c.strip() for c in args.commands.split(',') if c.strip()]
+    for name in commands:
+        if name not in COMMAND_ARGS:
+            parser.error('Unknown command: %s' % name)
+
+    root = args.workspace or tempfile.mkdtemp(prefix='gitctl-bench-')
+    workspace = Workspace(root, projects=args.projects, branches=args.branches,
+                          commits=args.commits, dirty=args.dirty, diverged=args.diverged,
+                          pinned=args.pinned, seed=args.seed)
+    try:
+        results = {
+            'environment' : environment(),
+            'parameters' : workspace.parameters,
+            'commands' : run_benchmark(workspace, commands, args.repeat),
+            }
+    finally:
+        if args.workspace is None:
+            shutil.rmtree(root)
+
+    for name in ['clone'] + commands:
+        timing = results['commands'][name]
+        print '%-10s best %.3fs median %.3fs' % (name, timing['best'], timing['median'])
+
+    if args.output:
+        json.dump(results, open(args.output, 'w'), indent=2, sort_keys=True)
+    if args.baseline:
+        print
+        print compare(results, json.load(open(args.baseline)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
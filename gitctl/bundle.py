@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Moving projects around as git bundles.
+
+A snapshot is a directory, or a single tar file, with a bundle of each
+project and a manifest of the refs in them. The bundles contain the upstream
+versions of the configured branches and the treeish of the project, under
+the same names as in the clone they were made from, so that unbundling them
+gives the same remote branches as fetching from the upstream.
+
+A snapshot can be made incremental to a previous one, in which case each
+bundle only contains the commits that are not in the previous snapshot and
+projects that have not changed are left out.
+"""
+import re
+import os
+import json
+import shutil
+import tarfile
+
+import git
+
+import gitctl.refs
+import gitctl.utils
+import gitctl.objects
+
+MANIFEST = 'manifest.json'
+
+# A pinned revision is not on any ref, so it is bundled under this name.
+TREEISH_REF = 'refs/gitctl/treeish'
+
+RE_REJECTED = re.compile(r'^ ! \[rejected\]\s+\S+\s+->\s+(\S+)', re.MULTILINE)
+
+def filename(directory, proj):
+    """Returns the name of the bundle of ``proj`` in the snapshot
+    ``directory``.
+    """
+    return os.path.join(directory, '%s.bundle' % proj['name'])
+
+def _execute(path, command):
+    return git.Git(path).execute(['git'] + command, with_extended_output=True,
+                                 with_exceptions=False)
+
+def tips(proj, path, config):
+    """Returns a mapping of the names of the refs to bundle for ``proj`` to
+    their SHA1s.
+    """
+    refs = dict((name, sha1) for sha1, name in gitctl.refs.show_ref(git.Git(path)))
+    names = ['refs/remotes/%s/%s' % (config['upstream'], local)
+             for remote, local in config['branches']]
+    treeish = proj['treeish']
+    result = dict((name, refs[name]) for name in names if name in refs)
+    if gitctl.utils.is_sha1(treeish):
+        if gitctl.objects.has_object(gitctl.refs.find_git_dir(path), treeish):
+            result[TREEISH_REF] = treeish.lower()
+    else:
+        for name in ('refs/tags/%s' % treeish,
+                     'refs/remotes/%s/%s' % (config['upstream'], treeish)):
+            if name in refs:
+                result[name] = refs[name]
+                break
+    return result
+
+def create(proj, path, output, config, previous=None):
+    """Writes the bundle of the repository of ``proj`` at ``path`` to
+    ``output``. If ``previous`` is the manifest entry of the project in a
+    previous snapshot only the commits that are not in it are bundled, and
+    nothing is written if the refs have not changed.
+
+    Returns a tuple of the manifest entry of the project and the stderr of
+    git on failure or None.
+    """
+    if os.path.exists(output):
+        os.remove(output)
+    current = tips(proj, path, config)
+    if not current:
+        return current, 'Nothing to bundle'
+    if previous == current:
+        return current, None
+
+    git_dir = gitctl.refs.find_git_dir(path)
+    prerequisites = ['^%s' % sha1 for sha1 in sorted(set((previous or {}).values()))
+                     if gitctl.objects.has_object(git_dir, sha1)]
+    if TREEISH_REF in current:
+        git.Git(path).update_ref(TREEISH_REF, current[TREEISH_REF])
+    try:
+        status, stdout, stderr = _execute(path, ['bundle', 'create', '--quiet', output] +
+                                          sorted(current) + prerequisites)
+    finally:
+        if TREEISH_REF in current:
+            git.Git(path).update_ref('-d', TREEISH_REF)
+    if status != 0:
+        return current, stderr.strip()
+    return current, None
+
+def refspecs(config):
+    """Returns the refspecs that fetch everything in a bundle. The remote
+    branches are only fast-forwarded and the tags are not moved, so that an
+    older snapshot does not take them back.
+    """
+    return ['refs/remotes/%s/*:refs/remotes/%s/*' % (config['upstream'], config['upstream']),
+            'refs/tags/*:refs/tags/*',
+            '+refs/gitctl/*:refs/gitctl/*']
+
+def unbundle(proj, bundle, config):
+    """Fetches the ``bundle`` into the repository of ``proj``. A project that
+    has not been cloned yet is set up like ``gitctl update`` clones it, with
+    the upstream URL as the remote.
+
+    Returns a tuple of a flag that is True if the project was cloned and
+    the names of the refs that were not updated because the bundle has an
+    older version of them. Raises ``git.errors.GitCommandError`` if git
+    fails otherwise.
+    """
+    path = gitctl.utils.project_path(proj)
+    cloned = not os.path.exists(path)
+    if cloned:
+        os.makedirs(path)
+        repository = git.Git(path)
+        repository.init('--quiet')
+        repository.remote('add', config['upstream'], proj['url'])
+    # Not quiet, as that hides the refs that were rejected.
+    command = ['fetch', os.path.abspath(bundle)] + refspecs(config)
+    status, stdout, stderr = _execute(path, command)
+    rejected = RE_REJECTED.findall(stderr)
+    if status != 0 and (cloned or not rejected or 'fatal:' in stderr):
+        if cloned:
+            # Leave it to ``gitctl update`` to clone over the network.
+            shutil.rmtree(path)
+        raise git.errors.GitCommandError(['git'] + command, status, stderr)
+    if cloned:
+        gitctl.utils.finish_clone(proj, git.Git(path), config)
+    return cloned, rejected
+
+def fast_forward(proj, path, config):
+    """Brings the local branches and the working directory of the existing
+    clone of ``proj`` at ``path`` up to date with the remote branches
+    without the network, like ``gitctl update`` does after fetching. The
+    local branches are only fast-forwarded and the checked out branch stays
+    checked out, and a pinned revision is checked out.
+
+    Returns a tuple of the names of the updated branches and of those that
+    cannot be fast-forwarded.
+    """
+    repository = git.Git(path)
+    refs = dict((name, sha1) for sha1, name in gitctl.refs.show_ref(repository))
+    status, head, stderr = _execute(path, ['symbolic-ref', '--quiet', 'HEAD'])
+    updated = []
+    diverged = []
+    for remote, local in config['branches']:
+        new = refs.get('refs/remotes/%s' % remote)
+        old = refs.get('refs/heads/%s' % local)
+        if new is None or old is None or new == old:
+            continue
+        if _execute(path, ['merge-base', '--is-ancestor', old, new])[0] != 0:
+            diverged.append(local)
+        elif head.strip() == 'refs/heads/%s' % local:
+            repository.merge('--ff-only', '--quiet', new)
+            updated.append(local)
+        else:
+            repository.update_ref('refs/heads/%s' % local, new, old)
+            updated.append(local)
+    treeish = proj['treeish']
+    if gitctl.utils.is_sha1(treeish) and gitctl.refs.rev_parse(repository, 'HEAD') != treeish.lower():
+        repository.reset('--hard', treeish)
+    return updated, diverged
+
+def read_manifest(path):
+    """Returns the manifest of the snapshot at ``path``, which is a snapshot
+    directory, a combined snapshot file or the manifest itself.
+    """
+    if os.path.isdir(path):
+        return json.load(open(os.path.join(path, MANIFEST)))
+    if tarfile.is_tarfile(path):
+        archive = tarfile.open(path)
+        try:
+            return json.load(archive.extractfile(MANIFEST))
+        finally:
+            archive.close()
+    return json.load(open(path))
+
+def write_manifest(directory, manifest):
+    """Writes the ``manifest`` to the snapshot ``directory``."""
+    out = open(os.path.join(directory, MANIFEST), 'w')
+    try:
+        json.dump(manifest, out, indent=2, sort_keys=True)
+    finally:
+        out.close()
+
+def combine(directory, output):
+    """Writes the snapshot ``directory`` to the single file ``output``."""
+    archive = tarfile.open(output, 'w')
+    try:
+        for name in sorted(os.listdir(directory)):
+            archive.add(os.path.join(directory, name), name)
+    finally:
+        archive.close()
+
+def extract(snapshot, directory):
+    """Extracts the combined ``snapshot`` file to ``directory``."""
+    archive = tarfile.open(snapshot)
+    try:
+        for member in archive.getmembers():
+            # Only the files combine() writes; nothing outside directory.
+            if member.isfile() and '/' not in member.name and (
+                member.name == MANIFEST or member.name.endswith('.bundle')):
+                archive.extract(member, directory)
+    finally:
+        archive.close()
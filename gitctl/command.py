@@ -2,125 +2,238 @@
 """Command handlers."""
 import os
 import sys
+import pipes
 import git
+import time
+import shutil
 import logging
+import tempfile
+import multiprocessing
 
+import gitctl.refs
+import gitctl.objects
 import gitctl.utils
+import gitctl.parallel
+import gitctl.network
+import gitctl.history
+import gitctl.log
+import gitctl.grep
+import gitctl.pool
+import gitctl.push
+import gitctl.bundle
+import gitctl.seed
+import gitctl.maintenance
 import gitctl.wtf
 
 LOG = logging.getLogger('gitctl')
 
 def gitctl_create(args):
     """Handles the 'gitctl create' command"""
-    project_path = os.path.realpath(os.path.join(os.getcwd(), args.project[0]))
-    project_name = os.path.basename(project_path)
     config = gitctl.utils.parse_config(args.config)
-    
-    if not os.path.exists(project_path):
-        LOG.critical('Project path %s does not exist!', project_path)
+    projects = []
+    for path in args.project:
+        project_path = os.path.realpath(os.path.join(os.getcwd(), path))
+        if not os.path.exists(project_path):
+            LOG.critical('Project path %s does not exist!', project_path)
+            sys.exit(1)
+        project_name = os.path.basename(project_path)
+        projects.append({'name' : project_name,
+                         'path' : project_path,
+                         'url' : '%s:%s.git' % (config['upstream-url'], project_name)})
+
+    # Make sure that none of the remote repositories exist already.
+    status, stdout, stderr = gitctl.utils.execute(['ssh', config['upstream-url'], 'ls', '-1a'],
+                                                  timeout=config['timeout'])
+    if status != 0:
+        LOG.critical('Listing the remote repositories failed: %s', stderr)
         sys.exit(1)
-    
-    project_url = '%s:%s.git' % (config['upstream-url'], project_name)
+    existing = set(stdout.split())
+    conflicts = [proj for proj in projects if '%s.git' % proj['name'] in existing]
+    for proj in conflicts:
+        LOG.error('Remote repository ``%s`` already exists. Aborting.', proj['url'])
+    if conflicts:
+        sys.exit(1)
+
+    # Set up all the remote bare repositories in a single session. HEAD is
+    # pointed to the development branch so cloning does not give an error.
+    initialize_remote = ['set -e']
+    for proj in projects:
+        initialize_remote.append("""\
+mkdir %(repository)s
+(cd %(repository)s &&
+ git --bare init --quiet &&
+ echo %(project)s > description &&
+ echo '. /usr/share/doc/git-core/contrib/hooks/post-receive-email' > hooks/post-receive &&
+ chmod a+x hooks/post-receive &&
+ git config hooks.mailinglist %(commit_email)s &&
+ git config hooks.emailprefix %(commit_email_prefix)s &&
+ git config hooks.emaildiff true &&
+ git symbolic-ref HEAD refs/heads/%(devbranch)s)""" % {
+            'repository' : pipes.quote('%s.git' % proj['name']),
+            'project' : pipes.quote(proj['name']),
+            'commit_email' : pipes.quote(config['commit-email']),
+            'commit_email_prefix' : pipes.quote('%s ' % config['commit-email-prefix']),
+            'devbranch' : pipes.quote(config['development-branch']) })
 
-    # Make sure that the remote repository does not exist already.
-    retcode = gitctl.utils.run('ssh %s test ! -d %s.git' % (config['upstream-url'], project_name))
-    if retcode != 0:
-        LOG.error('Remote repository ``%s`` already exists. Aborting.', project_url)
+    status, stdout, stderr = gitctl.utils.execute(['ssh', config['upstream-url'], 'sh', '-s'],
+                                                  timeout=config['timeout'],
+                                                  input='\n'.join(initialize_remote) + '\n')
+    if status != 0:
+        LOG.critical('Creating the remote repositories failed: %s', stderr)
         sys.exit(1)
-    
-    # Set up the remote bare repository
-    initialize_remote = """\
-    ssh %(upstream)s
-    "mkdir -p %(project)s.git && 
-     cd %(project)s.git && 
-     git --bare init && 
-     echo %(project)s > description && 
-     echo '. /usr/share/doc/git-core/contrib/hooks/post-receive-email' > hooks/post-receive &&
-     chmod a+x hooks/post-receive && 
-     git config hooks.mailinglist %(commit_email)s && 
-     git config hooks.emailprefix \\"%(commit_email_prefix)s \\" &&
-     git config hooks.emaildiff true"
-    """ % { 'upstream' : config['upstream-url'],
-            'project' : project_name,
-            'commit_email' : config['commit-email'],
-            'commit_email_prefix' : config['commit-email-prefix'] }
-    
-    gitctl.utils.run(' '.join([l.strip() for l in initialize_remote.splitlines()]))
-    LOG.info('Created new remote repository: %s', project_url)
-    
-    # Initialize the local directory.
-    repository = git.Git(project_path)
-    repository.init()
+    for proj in projects:
+        LOG.info('Created new remote repository: %s', proj['url'])
 
-    # Create the initial commit
-    repository.add('.')
-    repository.commit('-m', args.message)
-    
-    # Create local branches
-    for remote, local in config['branches']:
-        repository.branch(local)
-
-    # Push the initial structure to upstream
-    repository.remote('add', config['upstream'], project_url)
-    for remote, local in config['branches']:
-        repository.push(config['upstream'], local)
-    repository.fetch(config['upstream'])
-    
-    LOG.info('Created new local repository: %s', project_path)
-    
-    # Set up the local branches to track the remote ones
-    for remote, local in config['branches']:
-        repository.branch('-f', '--track', local, remote)
-        LOG.info('Branch ``%s`` is tracking ``%s``', local, remote)
-        
-    # Checkout the development branch 
-    repository.checkout(config['development-branch'])
-    # Get rid of the default master branch
-    repository.branch('-d', 'master')
-    
-    # Fix the HEAD ref in the upstream repo so cloning does not give an error
-    gitctl.utils.run('ssh %(upstream)s "echo ref: refs/heads/%(devbranch)s > %(project)s.git/HEAD"' % {
-        'upstream' : config['upstream-url'],
-        'devbranch' : config['development-branch'],
-        'project' : project_name,
-        })
-    
-    LOG.info('Checked out development branch ``%s``', config['development-branch'])
+    scheduler = gitctl.network.Scheduler(config)
+
+    def create(proj):
+        # Initialize the local directory.
+        repository = git.Git(proj['path'])
+        repository.init()
+
+        # Create the initial commit
+        repository.add('.')
+        repository.commit('-m', args.message)
+
+        # Create local branches
+        for remote, local in config['branches']:
+            repository.branch(local)
+
+        # Push the initial structure to upstream
+        repository.remote('add', config['upstream'], proj['url'])
+        try:
+            gitctl.utils.git_network(repository, config, 'push', config['upstream'],
+                                     *[local for remote, local in config['branches']])
+            gitctl.utils.git_network(repository, config, 'fetch', config['upstream'])
+        except git.errors.GitCommandError, x:
+            scheduler.failed(proj, x)
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
+
+        LOG.info('Created new local repository: %s', proj['path'])
+
+        # Set up the local branches to track the remote ones
+        for remote, local in config['branches']:
+            repository.branch('-f', '--track', local, remote)
+            LOG.info('Branch ``%s`` is tracking ``%s``', local, remote)
+
+        # Checkout the development branch
+        repository.checkout(config['development-branch'])
+        # Get rid of the default master branch
+        repository.branch('-d', 'master')
+
+        LOG.info('Checked out development branch ``%s``', config['development-branch'])
+        return True
+
+    results = gitctl.parallel.run(create, projects, jobs=gitctl.utils.jobs(args, config),
+                                  gate=scheduler)
+    return int(not all(results))
 
 def gitctl_fetch(args):
     """Fetches all projects."""
     projects = gitctl.utils.parse_externals(args.externals)
     config = gitctl.utils.parse_config(args.config)
-    
-    for proj in gitctl.utils.selected_projects(args, projects):
+    scheduler = gitctl.network.Scheduler(config)
+    timed_out = []
+
+    def fetch(proj):
         repository = git.Git(gitctl.utils.project_path(proj))
-        repository.fetch(config['upstream'])
+        try:
+            gitctl.utils.fetch(proj, repository, config)
+        except gitctl.utils.CommandTimeout, x:
+            timed_out.append(proj['name'])
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
+        except git.errors.GitCommandError, x:
+            scheduler.failed(proj, x)
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
         LOG.info('%s Fetched', gitctl.utils.pretty(proj['name']))
+        return True
+
+    selected = gitctl.utils.select_projects(args, projects)
+    jobs = gitctl.utils.jobs(args, config)
+    history = gitctl.history.History(gitctl.utils.state_file(args, 'history.json'))
+    try:
+        results = gitctl.parallel.run(gitctl.utils.locked(args, config, history.timed('fetch', fetch)),
+                                      selected, jobs=jobs,
+                                      order=history.order('fetch', selected, jobs), gate=scheduler)
+    finally:
+        history.save()
+    gitctl.utils.report_timeouts(timed_out, config)
+    return int(not all(results))
+
+def gitctl_prefetch(args):
+    """Downloads the new objects of all projects in the background without
+    changing the remote branches.
+    """
+    projects = gitctl.utils.parse_externals(args.externals)
+    config = gitctl.utils.parse_config(args.config)
+    scheduler = gitctl.network.Scheduler(config)
+    timed_out = []
+
+    def prefetch(proj):
+        path = gitctl.utils.project_path(proj)
+        if not os.path.exists(path):
+            # Cloning is left to ``gitctl update``.
+            return True
+        try:
+            gitctl.utils.prefetch(proj, git.Git(path), config)
+        except gitctl.utils.CommandTimeout, x:
+            timed_out.append(proj['name'])
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
+        except git.errors.GitCommandError, x:
+            scheduler.failed(proj, x)
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
+        if args.verbose:
+            LOG.info('%s Prefetched', gitctl.utils.pretty(proj['name']))
+        return True
+
+    selected = gitctl.utils.select_projects(args, projects)
+    jobs = gitctl.utils.jobs(args, config)
+    history = gitctl.history.History(gitctl.utils.state_file(args, 'history.json'))
+    try:
+        # No project locks: only refs/prefetch is changed, which no other
+        # command writes, so interactive commands never wait for a prefetch.
+        results = gitctl.parallel.run(history.timed('prefetch', prefetch), selected, jobs=jobs,
+                                      order=history.order('prefetch', selected, jobs),
+                                      gate=scheduler)
+    finally:
+        history.save()
+    gitctl.utils.report_timeouts(timed_out, config)
+    return int(not all(results))
 
 def gitctl_branch(args):
     """Operates on the project branches."""
     projects = gitctl.utils.parse_externals(args.externals)
     config = gitctl.utils.parse_config(args.config)
-    
-    for proj in gitctl.utils.selected_projects(args, projects):
+
+    def checkout(proj):
         repository = git.Repo(gitctl.utils.project_path(proj))
+        branch = args.checkout[0]
+        if repository.is_dirty:
+            LOG.info('%s Dirty working directory. Please commit or stash and try again.' % gitctl.utils.pretty(proj['name']))
+        else:
+            branches = gitctl.refs.branches(repository)
+            if branch not in branches:
+                LOG.warning('%s No such branch: ``%s``' % (gitctl.utils.pretty(proj['name']), branch))
+            elif branch == gitctl.refs.active_branch(repository) and args.verbose:
+                LOG.info('%s Already at ``%s``' % (gitctl.utils.pretty(proj['name']), branch))
+            else:
+                repository.git.checkout(branch)
+                LOG.info('%s Checked out ``%s``' % (gitctl.utils.pretty(proj['name']), branch))
+    checkout = gitctl.utils.locked(args, config, checkout)
+
+    for proj in gitctl.utils.selected_projects(args, projects):
         if not args.checkout and args.list:
+            repository = git.Repo(gitctl.utils.project_path(proj))
             LOG.info('%s %s' % (gitctl.utils.pretty(proj['name']),
-                                repository.active_branch))
+                                gitctl.refs.active_branch(repository)))
         
         if args.checkout:
-            branch = args.checkout[0]
-            if repository.is_dirty:
-                LOG.info('%s Dirty working directory. Please commit or stash and try again.' % gitctl.utils.pretty(proj['name']))
-            else:
-                branches = set([b.name for b in repository.branches])
-                if branch not in branches:
-                    LOG.warning('%s No such branch: ``%s``' % (gitctl.utils.pretty(proj['name']), branch))
-                elif branch == repository.active_branch and args.verbose:
-                    LOG.info('%s Already at ``%s``' % (gitctl.utils.pretty(proj['name']), branch))
-                else:
-                    repository.git.checkout(branch)
-                    LOG.info('%s Checked out ``%s``' % (gitctl.utils.pretty(proj['name']), branch))
+            checkout(proj)
 
 def gitctl_update(args):
     """Updates the external projects.
@@ -129,41 +242,103 @@ def gitctl_update(args):
     Otherwise it will cloned.
     """
     config = gitctl.utils.parse_config(args.config)
-    projects = gitctl.utils.parse_externals(args.externals)
+    if args.locked:
+        lock_file = gitctl.utils.lock_file(args.externals)
+        if not os.path.exists(lock_file):
+            LOG.critical('Lock file %s does not exist. Create it with ``gitctl lock``.', lock_file)
+            sys.exit(1)
+        # The lock file pins each project to a SHA1 revision
+        projects = gitctl.utils.parse_externals(lock_file)
+    else:
+        projects = gitctl.utils.parse_externals(args.externals)
+    scheduler = gitctl.network.Scheduler(config)
+    timed_out = []
 
-    for proj in gitctl.utils.selected_projects(args, projects):
+    def update(proj):
         path = gitctl.utils.project_path(proj)
         if os.path.exists(path):
             repository = git.Repo(path)
             try:
-                repository.git.fetch()
+                # The sparse patterns may have changed since the clone.
+                if gitctl.utils.set_sparse(proj, repository.git):
+                    if proj.get('sparse'):
+                        LOG.info('%s Sparse checkout of ``%s``', gitctl.utils.pretty(proj['name']),
+                                 ' '.join(proj['sparse']))
+                    else:
+                        LOG.info('%s Checked out the whole tree', gitctl.utils.pretty(proj['name']))
             except git.errors.GitCommandError, x:
-                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x.stderr)
+                return
+            refspecs = None
+            if gitctl.utils.is_sha1(proj['treeish']):
+                # Avoid the network when the pinned revision is already here.
+                pinned = proj['treeish'].lower()
+                if gitctl.refs.rev_parse(repository, 'HEAD') == pinned:
+                    # Nothing to do, but local changes are still pointed out.
+                    if repository.is_dirty:
+                        LOG.info('%s Dirty working directory. Please commit or stash and try again.', gitctl.utils.pretty(proj['name']))
+                    elif args.verbose:
+                        LOG.info('%s OK', gitctl.utils.pretty(proj['name']))
+                    return
+                if gitctl.objects.has_object(gitctl.refs.git_dir(repository), pinned):
+                    if repository.is_dirty:
+                        LOG.info('%s Dirty working directory. Please commit or stash and try again.', gitctl.utils.pretty(proj['name']))
+                    else:
+                        repository.git.reset('--hard', pinned)
+                        LOG.info('%s Checked out revision ``%s``', gitctl.utils.pretty(proj['name']), proj['treeish'])
+                    return
+                # Only the missing revision is needed.
+                refspecs = [pinned]
+
+            if refspecs is None and not args.fresh and gitctl.utils.is_fresh(repository, config):
+                LOG.debug('%s Fetched recently, not fetching', gitctl.utils.pretty(proj['name']))
+            else:
+                try:
+                    try:
+                        gitctl.utils.fetch(proj, repository.git, config, refspecs=refspecs)
+                    except gitctl.utils.CommandTimeout:
+                        raise
+                    except git.errors.GitCommandError, x:
+                        if refspecs is None:
+                            raise
+                        # The server does not allow fetching a revision by its
+                        # SHA1, so fetch the branches that may contain it.
+                        LOG.debug('%s Fetching ``%s`` failed: %s', gitctl.utils.pretty(proj['name']),
+                                  proj['treeish'], x.stderr)
+                        gitctl.utils.fetch(proj, repository.git, config, pin=False)
+                except gitctl.utils.CommandTimeout, x:
+                    # Do not wait for the upstream again in the pulls below.
+                    timed_out.append(proj['name'])
+                    LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+                    return
+                except git.errors.GitCommandError, x:
+                    scheduler.failed(proj, x)
+                    LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
             
             if repository.is_dirty:
                 LOG.info('%s Dirty working directory. Please commit or stash and try again.', gitctl.utils.pretty(proj['name']))
-                continue
+                return
 
             ok = True
             updated = False
 
             if gitctl.utils.is_sha1(proj['treeish']):
                 # We're dealing with an explicit version pin.
-                pinned_at = repository.git.rev_parse('HEAD').strip()
+                pinned_at = gitctl.refs.rev_parse(repository, 'HEAD')
                 treeish = proj['treeish']
                 # Simply do a hard reset to the requested revision
                 repository.git.reset('--hard', treeish)
             else:
                 # We're dealing with a dynamic branch pointer
                 pinned_at = None
-                treeish = repository.active_branch
+                treeish = gitctl.refs.active_branch(repository)
 
-                remote_branches = set(repository.git.branch('-r').split())
-                local_branches = set(repository.git.branch().split())
+                remote_branches = gitctl.refs.branches(repository, remote=True)
+                local_branches = gitctl.refs.branches(repository)
 
                 for remote, local in config['branches']:
                     if remote in remote_branches and local in local_branches:
-                        if repository.git.rev_parse(remote) == repository.git.rev_parse(local):
+                        if gitctl.refs.rev_parse(repository, remote) == gitctl.refs.rev_parse(repository, local):
                             # Skip branches that have not changed.
                             continue
 
@@ -172,11 +347,18 @@ def gitctl_update(args):
 
                         # Use a remote:local refspec to pull the given branch. We omit the + from the
                         # refspec to attempt a fast-forward merge.
-                        status, stdout, stderr = repository.git.pull(
-                            config['upstream'],
-                            '%s:%s' % (local, local),
-                            with_exceptions=False,
-                            with_extended_output=True)
+                        try:
+                            status, stdout, stderr = gitctl.utils.git_network(
+                                repository.git, config, 'pull',
+                                config['upstream'],
+                                '%s:%s' % (local, local),
+                                with_exceptions=False,
+                                with_extended_output=True)
+                        except gitctl.utils.CommandTimeout, x:
+                            timed_out.append(proj['name'])
+                            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+                            ok = False
+                            break
 
                         if status != 0:
                             ok = False
@@ -187,6 +369,7 @@ def gitctl_update(args):
                                 LOG.warning('%s Fast forward merge not possible for branch ``%s``. Try syncing with upstream manually (pull, push or merge).', gitctl.utils.pretty(proj['name']), local)
                             else:
                                 # Some other kind of error.
+                                scheduler.failed(proj, stderr)
                                 LOG.critical('%s Update failure: %s', gitctl.utils.pretty(proj['name']), stderr)
                         else:
                             updated = True
@@ -208,21 +391,124 @@ def gitctl_update(args):
                     LOG.info('%s OK', gitctl.utils.pretty(proj['name']))
 
         else:
+            source = args.seed and gitctl.seed.find(
+                proj, args.seed, os.path.dirname(os.path.abspath(args.externals)))
+            if source:
+                try:
+                    gitctl.seed.clone(source, path, config, proj['url'])
+                except git.errors.GitCommandError, x:
+                    # A broken seed must not look like a clone to the next
+                    # update, so start over from the upstream.
+                    if os.path.exists(path):
+                        shutil.rmtree(path)
+                    LOG.error('%s ERROR Cloning from the seed failed: %s',
+                              gitctl.utils.pretty(proj['name']), x.stderr or x)
+                else:
+                    try:
+                        # Only what the seed does not have yet
+                        gitctl.utils.fetch(proj, git.Git(path), config)
+                    except git.errors.GitCommandError, x:
+                        # Leave it to the next update to clone again.
+                        shutil.rmtree(path)
+                        if isinstance(x, gitctl.utils.CommandTimeout):
+                            timed_out.append(proj['name'])
+                        else:
+                            scheduler.failed(proj, x)
+                        LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+                        return
+                    gitctl.utils.finish_clone(proj, git.Git(path), config)
+                    LOG.info('%s Cloned from the seed and checked out ``%s``',
+                             gitctl.utils.pretty(proj['name']), proj['treeish'])
+                    return
+
             # Clone the repository
             temp = git.Git('/tmp')
-            temp.clone('--no-checkout', '--origin', config['upstream'],  proj['url'], path)
-
-            # Set up the local tracking branches
-            repository = git.Git(path)
-            remote_branches = set(repository.branch('-r').split())
-            local_branches = set(repository.branch().split())
-            for remote, local in config['branches']:
-                if remote in remote_branches and local not in local_branches:
-                    repository.branch('-f', '--track', local, remote)
-            # Check out the given treeish
-            repository.checkout(proj['treeish'])
+            try:
+                gitctl.utils.git_network(temp, config, 'clone', '--no-checkout',
+                                         '--origin', config['upstream'], proj['url'], path)
+            except gitctl.utils.CommandTimeout, x:
+                timed_out.append(proj['name'])
+                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+                return
+
+            gitctl.utils.finish_clone(proj, git.Git(path), config)
             LOG.info('%s Cloned and checked out ``%s``', gitctl.utils.pretty(proj['name']), proj['treeish'])
 
+    def operation(proj):
+        return os.path.exists(gitctl.utils.project_path(proj)) and 'update' or 'clone'
+
+    selected = gitctl.utils.select_projects(args, projects)
+    jobs = gitctl.utils.jobs(args, config)
+    history = gitctl.history.History(gitctl.utils.state_file(args, 'history.json'))
+    try:
+        gitctl.parallel.run(gitctl.utils.locked(args, config, history.timed(operation, update)),
+                            selected, jobs=jobs,
+                            order=history.order(operation, selected, jobs), gate=scheduler)
+    finally:
+        history.save()
+    gitctl.utils.report_timeouts(timed_out, config)
+
+def gitctl_lock(args):
+    """Writes the lock file which pins each project to the revision its
+    treeish currently resolves to, or verifies that the projects are checked
+    out at the locked revisions.
+    """
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    lock_file = gitctl.utils.lock_file(args.externals)
+    locked = {}
+    if os.path.exists(lock_file):
+        locked = dict((p['name'], p) for p in gitctl.utils.parse_externals(lock_file))
+    elif args.verify:
+        LOG.critical('Lock file %s does not exist. Create it with ``gitctl lock``.', lock_file)
+        sys.exit(1)
+
+    ok = True
+    for proj in gitctl.utils.selected_projects(args, projects):
+        path = gitctl.utils.project_path(proj)
+        if not os.path.exists(path):
+            LOG.error('%s Not cloned. Run ``gitctl update`` first.', gitctl.utils.pretty(proj['name']))
+            ok = False
+            continue
+        repository = git.Git(path)
+
+        if args.verify:
+            lock = locked.get(proj['name'])
+            if lock is None:
+                LOG.error('%s Not in the lock file', gitctl.utils.pretty(proj['name']))
+                ok = False
+            elif (lock['url'], lock['container']) != (proj['url'], proj['container']):
+                LOG.error('%s The lock file is out of date', gitctl.utils.pretty(proj['name']))
+                ok = False
+            else:
+                head = gitctl.refs.rev_parse(repository, 'HEAD')
+                if head != lock['treeish']:
+                    LOG.error('%s At revision %s, locked at %s', gitctl.utils.pretty(proj['name']),
+                              head, lock['treeish'])
+                    ok = False
+                elif args.verbose:
+                    LOG.info('%s OK', gitctl.utils.pretty(proj['name']))
+        else:
+            try:
+                sha1 = gitctl.utils.locked_revision(repository, proj, config)
+            except git.errors.GitCommandError:
+                LOG.error('%s Unknown treeish ``%s``', gitctl.utils.pretty(proj['name']), proj['treeish'])
+                ok = False
+                continue
+            locked[proj['name']] = dict(proj, treeish=sha1)
+            LOG.info('%s Locked ``%s`` at %s', gitctl.utils.pretty(proj['name']), proj['treeish'], sha1)
+
+    if not args.verify and ok:
+        # Projects that were removed from the externals are dropped.
+        lock = [dict(locked[p['name']]) for p in projects if p['name'] in locked]
+        out = open(lock_file, 'w')
+        try:
+            print >> out, '# Generated by gitctl lock from %s.' % os.path.basename(args.externals)
+            print >> out, gitctl.utils.generate_externals(lock)
+        finally:
+            out.close()
+    return int(not ok)
+
 def gitctl_path(args):
     """Give the path to project directory."""
     config = gitctl.utils.parse_config(args.config)
@@ -263,11 +549,23 @@ def gitctl_status(args):
             commit_limit = args.limit
 
     main_branches = (config['development-branch'], config['staging-branch'], config['production-branch'])
+    timed_out = []
+
+    def fetch(proj):
+        try:
+            gitctl.utils.fetch(proj, git.Git(gitctl.utils.project_path(proj)), config)
+        except gitctl.utils.CommandTimeout, x:
+            # Show the status as of the previous fetch
+            timed_out.append(proj['name'])
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+    # Only fetching changes the project; the rest is read without locks.
+    fetch = gitctl.utils.locked(args, config, fetch)
+
     for proj in gitctl.utils.selected_projects(args, projects):
         repository = git.Repo(gitctl.utils.project_path(proj))
-        if not args.no_fetch:
+        if not args.no_fetch and (args.fresh or not gitctl.utils.is_fresh(repository, config)):
             # Fetch upstream
-            repository.git.fetch(config['upstream'])
+            fetch(proj)
 
         output = []
         branches = gitctl.wtf.branch_structure(repository)
@@ -290,6 +588,7 @@ def gitctl_status(args):
             LOG.info(proj['name'])
             LOG.info('-' * len(proj['name']))
             LOG.info('\n'.join(output))
+    gitctl.utils.report_timeouts(timed_out, config)
 
 def gitctl_pending(args):
     """Checks for pending changes between two consecutive states in our
@@ -298,12 +597,24 @@ def gitctl_pending(args):
     config = gitctl.utils.parse_config(args.config)
     projects = gitctl.utils.parse_externals(args.externals)
 
+    timed_out = []
+
+    def fetch(proj):
+        try:
+            gitctl.utils.fetch(proj, git.Git(gitctl.utils.project_path(proj)), config)
+        except gitctl.utils.CommandTimeout, x:
+            timed_out.append(proj['name'])
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
+        return True
+    # Only fetching changes the project; the rest is read without locks.
+    fetch = gitctl.utils.locked(args, config, fetch)
+
     for proj in gitctl.utils.selected_projects(args, projects):
         project_path = gitctl.utils.project_path(proj)
         repository = git.Repo(project_path)
         
-        local_branches = set(repository.git.branch().split())
-        remote_branches = set(repository.git.branch('-r').split())
+        local_branches = gitctl.refs.branches(repository)
         
         def assert_branch(branch, quiet=False):
             if branch in local_branches:
@@ -327,15 +638,16 @@ def gitctl_pending(args):
             continue
         
         # Update the remotes
-        if not args.no_fetch:
-            repository.git.fetch(config['upstream'])
+        if (not args.no_fetch and (args.fresh or not gitctl.utils.is_fresh(repository, config))
+            and not fetch(proj)):
+            continue
 
         if not gitctl.utils.is_sha1(proj['treeish']):
             LOG.warning('%s Treeish is not a SHA1 revision: %s', gitctl.utils.pretty(proj['name']), proj['treeish'])
             continue
     
-        from_ = repository.git.rev_parse(proj['treeish'])
-        to = repository.git.rev_parse('%s/%s' % (config['upstream'], config['production-branch']))
+        from_ = gitctl.refs.rev_parse(repository, proj['treeish'])
+        to = gitctl.refs.rev_parse(repository, '%s/%s' % (config['upstream'], config['production-branch']))
         
         if from_ != to:
             # The comparison branch has advanced.
@@ -350,8 +662,446 @@ def gitctl_pending(args):
             if args.verbose and not args.show_config:
                 LOG.info('%s OK', gitctl.utils.pretty(proj['name']))
         
+    gitctl.utils.report_timeouts(timed_out, config)
+    if args.show_config:
+        LOG.info(gitctl.utils.generate_externals(projects))
+
+def gitctl_maintain(args):
+    """Runs repository maintenance on the projects."""
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    start = time.time()
+
+    def maintain(proj):
+        result = gitctl.maintenance.maintain(gitctl.utils.project_path(proj), config,
+                                             prune=not args.no_prune)
+        for command, error in result['failed']:
+            LOG.warning('%s ``git %s`` failed: %s', gitctl.utils.pretty(proj['name']), command, error)
+        LOG.info('%s Maintained in %.1fs, reclaimed %s', gitctl.utils.pretty(proj['name']),
+                 result['time'], gitctl.maintenance.format_size(result['reclaimed']))
+        return result
+
+    # Pruning talks to the upstream hosts.
+    results = gitctl.parallel.run(gitctl.utils.locked(args, config, maintain),
+                                  gitctl.utils.select_projects(args, projects),
+                                  jobs=gitctl.utils.jobs(args, config),
+                                  gate=not args.no_prune and gitctl.network.Scheduler(config) or None)
+    # Projects locked by another process are skipped.
+    results = [result for result in results if result]
+    LOG.info('Maintained %d project(s) in %.1fs, reclaimed %s in total', len(results),
+             time.time() - start,
+             gitctl.maintenance.format_size(sum(r['reclaimed'] for r in results)))
+
+def gitctl_log(args):
+    """Shows the commits of the projects as a single log, newest first."""
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    branch = config['%s-branch' % args.branch]
+
+    producers = []
+    for proj in gitctl.utils.selected_projects(args, projects):
+        path = gitctl.utils.project_path(proj)
+        if not os.path.exists(path):
+            LOG.warning('%s Not cloned', gitctl.utils.pretty(proj['name']))
+            continue
+        # The upstream version of the branch is preferred as it has the
+        # latest fetched commits.
+        revision = 'refs/remotes/%s/%s' % (config['upstream'], branch)
+        reader = gitctl.refs.refs(git.Git(path))
+        if reader.supported:
+            candidates = [revision, 'refs/heads/%s' % branch]
+            # The SHA1 keeps the pages of the log consistent if the branch
+            # is moved while it is being read.
+            sha1s = [reader.read(name) for name in candidates]
+            revision = ([sha1 for sha1 in sha1s if sha1 is not None] or [None])[0]
+            if revision is None:
+                if args.verbose:
+                    LOG.info('%s No branch ``%s``', gitctl.utils.pretty(proj['name']), branch)
+                continue
+        command = ['git', 'log', '--format=%s' % gitctl.log.FORMAT]
+        if args.since:
+            command.append('--since=%s' % args.since)
+        command.extend([revision, '--'])
+        # No project can contribute more than the whole log.
+        producers.append(gitctl.log.Producer(proj['name'], command, path, limit=args.max_count))
+
+    # Reading the logs is local, so use all the processors unless told
+    # otherwise.
+    jobs = args.jobs or max(config['jobs'], multiprocessing.cpu_count())
+    for commit in gitctl.log.merge(producers, limit=args.max_count, jobs=jobs):
+        LOG.info('%s %s %s %s (%s)', time.strftime('%Y-%m-%d %H:%M', time.localtime(commit.timestamp)),
+                 gitctl.utils.pretty(commit.project, 30), commit.sha1[:10], commit.subject,
+                 commit.author)
+    for producer in producers:
+        if producer.error:
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(producer.project), producer.error)
+    return int(any(producer.error for producer in producers))
+
+def gitctl_grep(args):
+    """Searches the projects with ``git grep``."""
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+
+    searches = []
+    for proj in gitctl.utils.selected_projects(args, projects):
+        path = gitctl.utils.project_path(proj)
+        if not os.path.exists(path):
+            LOG.warning('%s Not cloned', gitctl.utils.pretty(proj['name']))
+            continue
+        # Search the pinned treeish unless a branch is given. Branches are
+        # searched in their fetched upstream version.
+        name = args.branch and config['%s-branch' % args.branch] or proj['treeish']
+        revision = name
+        if not gitctl.utils.is_sha1(name):
+            reader = gitctl.refs.refs(git.Git(path))
+            upstream = 'refs/remotes/%s/%s' % (config['upstream'], name)
+            if reader.supported and reader.read(upstream) is not None:
+                revision = upstream
+        command = gitctl.grep.command(args.pattern, revision, ignore_case=args.ignore_case,
+                                      max_count=args.max_count)
+        searches.append((proj['name'], revision, command, path))
+
+    # Searching is local, so use all the processors unless told otherwise.
+    jobs = args.jobs or max(config['jobs'], multiprocessing.cpu_count())
+    search = gitctl.grep.Search(searches, jobs)
+    found = False
+    for match in search.matches(limit=args.max_count):
+        LOG.info('%s/%s:%d:%s', match.project, match.path, match.lineno, match.line)
+        found = True
+    for name, error in sorted(search.errors.items()):
+        LOG.error('%s ERROR %s', gitctl.utils.pretty(name), error)
+    # Like grep, exit with 1 when nothing was found and 2 on errors.
+    if search.errors:
+        return 2
+    return int(not found)
+
+def gitctl_dedupe(args):
+    """Moves the objects shared by projects with overlapping history into
+    shared pool repositories.
+    """
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    jobs = gitctl.utils.jobs(args, config)
+    start = time.time()
+
+    selected = [proj for proj in gitctl.utils.select_projects(args, projects)
+                if os.path.exists(gitctl.utils.project_path(proj))]
+    roots = dict(zip([proj['name'] for proj in selected],
+                     gitctl.parallel.run(lambda proj: gitctl.pool.root_commits(
+                         gitctl.utils.project_path(proj)), selected, jobs=jobs)))
+
+    ok, reclaimed = True, 0
+    for group in gitctl.pool.overlapping(selected, roots):
+        pool = gitctl.utils.state_file(args, os.path.join(
+            'pools', '%s.git' % gitctl.pool.pool_name(group, roots)))
+        gitctl.pool.create(pool)
+        members = []
+        for proj in group:
+            error = gitctl.pool.add(pool, proj['name'],
+                                    gitctl.refs.find_git_dir(gitctl.utils.project_path(proj)))
+            if error:
+                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), error)
+                ok = False
+            else:
+                members.append(proj)
+        gitctl.maintenance.maintain(pool, config, prune=False)
+
+        def dedupe(proj):
+            result = gitctl.pool.dedupe(pool, gitctl.utils.project_path(proj))
+            if result['error']:
+                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), result['error'])
+            else:
+                LOG.info('%s Deduplicated in %.1fs, reclaimed %s', gitctl.utils.pretty(proj['name']),
+                         result['time'], gitctl.maintenance.format_size(result['reclaimed']))
+            return result
+
+        for result in gitctl.parallel.run(gitctl.utils.locked(args, config, dedupe), members,
+                                          jobs=jobs):
+            if not result:
+                # Locked by another process
+                ok = False
+                continue
+            ok = ok and not result['error']
+            reclaimed += result['reclaimed']
+
+    LOG.info('Deduplicated in %.1fs, reclaimed %s in total', time.time() - start,
+             gitctl.maintenance.format_size(reclaimed))
+    return int(not ok)
+
+def gitctl_push(args):
+    """Pushes the configured branches that are ahead of the upstream
+    repository.
+    """
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    scheduler = gitctl.network.Scheduler(config)
+    timed_out = []
+    rejected = []
+
+    def push(proj):
+        path = gitctl.utils.project_path(proj)
+        branches = gitctl.push.ahead(git.Repo(path), config)
+        if not branches:
+            if args.verbose:
+                LOG.info('%s Nothing to push', gitctl.utils.pretty(proj['name']))
+            return True
+        described = ', '.join('%s (%d commit(s))' % (branch, len(commits))
+                              for branch, commits in branches)
+        if args.dry_run:
+            LOG.info('%s Would push %s', gitctl.utils.pretty(proj['name']), described)
+            return True
+
+        command = gitctl.push.command(config['upstream'], [branch for branch, commits in branches])
+        try:
+            status, stdout, stderr = gitctl.utils.git_network(git.Git(path), config, *command,
+                                                              with_exceptions=False,
+                                                              with_extended_output=True)
+        except gitctl.utils.CommandTimeout, x:
+            timed_out.append(proj['name'])
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
+        updates = [update for update in gitctl.push.parse(stdout) if update.rejected]
+        if status == 0:
+            LOG.info('%s Pushed %s', gitctl.utils.pretty(proj['name']), described)
+            return True
+        if not updates:
+            # Rejected before the refs were considered, e.g. no access.
+            scheduler.failed(proj, stderr)
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), stderr.strip())
+            return False
+        for update in updates:
+            rejected.append((proj['name'], update))
+            LOG.error('%s ERROR Rejected %s: %s', gitctl.utils.pretty(proj['name']), update.branch,
+                      update.reason)
+        return False
+
+    results = gitctl.parallel.run(gitctl.utils.locked(args, config, push),
+                                  gitctl.utils.select_projects(args, projects),
+                                  jobs=gitctl.utils.jobs(args, config), gate=scheduler)
+    gitctl.utils.report_timeouts(timed_out, config)
+    if rejected:
+        # The other branches of an atomic push are rejected along with the
+        # one that caused it; only the causes are worth a summary.
+        causes = [(name, update) for name, update in rejected
+                  if update.reason != 'atomic push failed'] or rejected
+        LOG.error('Rejected %d branch(es), nothing was pushed in %d project(s): %s', len(causes),
+                  len(set(name for name, update in rejected)),
+                  ', '.join('%s %s (%s)' % (name, update.branch, update.reason)
+                            for name, update in causes))
+    return int(not all(results))
+
+def gitctl_promote(args):
+    """Fast-forwards the upstream staging or production branches to the
+    previous branch in the workflow.
+    """
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    source = config[{'staging' : 'development-branch',
+                     'production' : 'staging-branch'}[args.to]]
+    target = config['%s-branch' % args.to]
+    remote_source = '%s/%s' % (config['upstream'], source)
+    remote_target = '%s/%s' % (config['upstream'], target)
+    scheduler = gitctl.network.Scheduler(config)
+    timed_out = []
+    planned = {}
+    promoted = {}
+
+    def plan(proj):
+        repository = git.Repo(gitctl.utils.project_path(proj))
+        if not args.no_fetch:
+            try:
+                gitctl.utils.fetch(proj, repository.git, config)
+            except gitctl.utils.CommandTimeout, x:
+                timed_out.append(proj['name'])
+                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+                return False
+            except git.errors.GitCommandError, x:
+                scheduler.failed(proj, x)
+                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+                return False
+
+        remote_branches = gitctl.refs.branches(repository, remote=True)
+        if remote_source not in remote_branches or remote_target not in remote_branches:
+            # Not using our repository layout, e.g. a 3rd party package.
+            if args.verbose:
+                LOG.info('%s Skipping.', gitctl.utils.pretty(proj['name']))
+            return True
+        source_sha1 = gitctl.refs.rev_parse(repository, 'refs/remotes/%s' % remote_source)
+        target_sha1 = gitctl.refs.rev_parse(repository, 'refs/remotes/%s' % remote_target)
+        if source_sha1 == target_sha1:
+            if args.verbose:
+                LOG.info('%s ``%s`` is up to date', gitctl.utils.pretty(proj['name']), target)
+            promoted[proj['name']] = target_sha1
+            return True
+        if gitctl.wtf.commits_between(repository, remote_source, remote_target, verbose=False):
+            LOG.error('%s ERROR ``%s`` has commits that are not in ``%s``, cannot fast-forward',
+                      gitctl.utils.pretty(proj['name']), target, source)
+            return False
+
+        commits = len(gitctl.wtf.commits_between(repository, remote_target, remote_source,
+                                                 verbose=False))
+        if args.dry_run:
+            LOG.info('%s Would promote %d commit(s) from ``%s`` to ``%s``',
+                     gitctl.utils.pretty(proj['name']), commits, source, target)
+            promoted[proj['name']] = source_sha1
+        else:
+            planned[proj['name']] = (source_sha1, commits)
+        return True
+
+    def push(proj):
+        path = gitctl.utils.project_path(proj)
+        sha1, commits = planned[proj['name']]
+        try:
+            # The commit is pushed as is; nothing is checked out.
+            status, stdout, stderr = gitctl.utils.git_network(
+                git.Git(path), config, 'push', '--porcelain', config['upstream'],
+                '%s:refs/heads/%s' % (sha1, target),
+                with_exceptions=False, with_extended_output=True)
+        except gitctl.utils.CommandTimeout, x:
+            timed_out.append(proj['name'])
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x)
+            return False
+        if status != 0:
+            updates = [update for update in gitctl.push.parse(stdout) if update.rejected]
+            if updates:
+                LOG.error('%s ERROR Rejected %s: %s', gitctl.utils.pretty(proj['name']), target,
+                          updates[0].reason)
+            else:
+                scheduler.failed(proj, stderr)
+                LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), stderr.strip())
+            return False
+
+        # Fast-forward the local branch as well unless it has commits of
+        # its own or is checked out.
+        repository = git.Repo(path)
+        if (target in gitctl.refs.branches(repository)
+            and target != gitctl.refs.active_branch(repository)
+            and not gitctl.wtf.commits_between(repository, sha1, 'heads/%s' % target,
+                                               verbose=False)):
+            repository.git.update_ref('refs/heads/%s' % target, sha1)
+        promoted[proj['name']] = sha1
+        LOG.info('%s Promoted %d commit(s) from ``%s`` to ``%s``', gitctl.utils.pretty(proj['name']),
+                 commits, source, target)
+        return True
+
+    selected = gitctl.utils.select_projects(args, projects)
+    jobs = gitctl.utils.jobs(args, config)
+    results = gitctl.parallel.run(gitctl.utils.locked(args, config, plan), selected, jobs=jobs,
+                                  gate=scheduler)
+    # All the pushes go out in one batch once every project has been checked.
+    results.extend(gitctl.parallel.run(gitctl.utils.locked(args, config, push),
+                                       [proj for proj in selected if proj['name'] in planned],
+                                       jobs=jobs, gate=scheduler))
+    gitctl.utils.report_timeouts(timed_out, config)
     if args.show_config:
+        for proj in projects:
+            if proj['name'] in promoted:
+                proj['treeish'] = promoted[proj['name']]
         LOG.info(gitctl.utils.generate_externals(projects))
+    return int(not all(results))
+
+def gitctl_bundle(args):
+    """Writes a snapshot of the projects as git bundles."""
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    previous = {}
+    if args.since:
+        previous = gitctl.bundle.read_manifest(args.since)
+    if args.combined:
+        directory = tempfile.mkdtemp()
+    else:
+        directory = args.output
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    manifest = {}
+
+    def bundle(proj):
+        path = gitctl.utils.project_path(proj)
+        if not os.path.exists(path):
+            LOG.warning('%s Not cloned', gitctl.utils.pretty(proj['name']))
+            return False
+        output = gitctl.bundle.filename(directory, proj)
+        tips, error = gitctl.bundle.create(proj, path, output, config, previous.get(proj['name']))
+        if error:
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), error)
+            return False
+        manifest[proj['name']] = tips
+        if os.path.exists(output):
+            LOG.info('%s Bundled %d ref(s), %s', gitctl.utils.pretty(proj['name']), len(tips),
+                     gitctl.maintenance.format_size(os.path.getsize(output)))
+        elif args.verbose:
+            LOG.info('%s Unchanged since the previous snapshot', gitctl.utils.pretty(proj['name']))
+        return True
+
+    try:
+        results = gitctl.parallel.run(gitctl.utils.locked(args, config, bundle),
+                                      gitctl.utils.select_projects(args, projects),
+                                      jobs=gitctl.utils.jobs(args, config))
+        gitctl.bundle.write_manifest(directory, manifest)
+        if args.combined:
+            gitctl.bundle.combine(directory, args.output)
+    finally:
+        if args.combined:
+            shutil.rmtree(directory)
+    return int(not all(results))
+
+def gitctl_unbundle(args):
+    """Clones or updates the projects from a snapshot written by
+    ``gitctl bundle``.
+    """
+    config = gitctl.utils.parse_config(args.config)
+    projects = gitctl.utils.parse_externals(args.externals)
+    directory = args.snapshot
+    if not os.path.isdir(directory):
+        directory = tempfile.mkdtemp()
+        gitctl.bundle.extract(args.snapshot, directory)
+
+    def unbundle(proj):
+        bundle = gitctl.bundle.filename(directory, proj)
+        if not os.path.exists(bundle):
+            if args.verbose:
+                LOG.info('%s Not in the snapshot', gitctl.utils.pretty(proj['name']))
+            return True
+        path = gitctl.utils.project_path(proj)
+        try:
+            cloned, rejected = gitctl.bundle.unbundle(proj, bundle, config)
+            if cloned:
+                LOG.info('%s Cloned and checked out ``%s``', gitctl.utils.pretty(proj['name']),
+                         proj['treeish'])
+                return True
+            for name in rejected:
+                LOG.warning('%s Kept ``%s``, the snapshot has an older version of it',
+                            gitctl.utils.pretty(proj['name']), name)
+            if git.Repo(path).is_dirty:
+                LOG.info('%s Fetched. Dirty working directory, not updated. Please commit or stash and try again.',
+                         gitctl.utils.pretty(proj['name']))
+                return True
+            pinned_at = gitctl.refs.rev_parse(git.Git(path), 'HEAD')
+            updated, diverged = gitctl.bundle.fast_forward(proj, path, config)
+        except git.errors.GitCommandError, x:
+            LOG.error('%s ERROR %s', gitctl.utils.pretty(proj['name']), x.stderr.strip() or x)
+            return False
+        for local in diverged:
+            LOG.warning('%s Fast forward merge not possible for branch ``%s``. Try syncing with upstream manually (pull, push or merge).',
+                        gitctl.utils.pretty(proj['name']), local)
+        if gitctl.utils.is_sha1(proj['treeish']) and pinned_at != proj['treeish'].lower():
+            LOG.info('%s Checked out revision ``%s``', gitctl.utils.pretty(proj['name']), proj['treeish'])
+        elif updated:
+            LOG.info('%s Updated', gitctl.utils.pretty(proj['name']))
+        else:
+            LOG.info('%s Fetched', gitctl.utils.pretty(proj['name']))
+        return True
+
+    try:
+        results = gitctl.parallel.run(gitctl.utils.locked(args, config, unbundle),
+                                      gitctl.utils.select_projects(args, projects),
+                                      jobs=gitctl.utils.jobs(args, config))
+    finally:
+        if directory != args.snapshot:
+            shutil.rmtree(directory)
+    return int(not all(results))
 
-__all__ = ['gitctl_create', 'gitctl_fetch', 'gitctl_update', 'gitctl_path', 'gitctl_sh',  'gitctl_status',
-           'gitctl_pending', 'gitctl_branch']
+__all__ = ['gitctl_create', 'gitctl_fetch', 'gitctl_prefetch', 'gitctl_update', 'gitctl_path', 'gitctl_sh',  'gitctl_status',
+           'gitctl_pending', 'gitctl_branch', 'gitctl_maintain', 'gitctl_lock', 'gitctl_log',
+           'gitctl_grep', 'gitctl_dedupe', 'gitctl_push', 'gitctl_promote',
+           'gitctl_bundle', 'gitctl_unbundle']
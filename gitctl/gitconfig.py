@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""In-process reading of the repository configuration.
+
+Parses the system and global configuration, ``.git/config`` and the files
+they include without starting ``git config``. The parsed configuration is
+cached per repository and reused until one of the files it was read from
+changes.
+"""
+import os
+import fnmatch
+
+import gitctl.refs
+
+# Maximum nesting of include files, the same limit git uses.
+MAX_INCLUDE_DEPTH = 10
+# The system configuration file of git installed under /usr. git built with
+# another prefix reads $(prefix)/etc/gitconfig, which GIT_CONFIG_SYSTEM can
+# point to.
+SYSTEM_CONFIG = '/etc/gitconfig'
+
+ESCAPES = {'n' : '\n', 't' : '\t', 'b' : '\b', '\\' : '\\', '"' : '"'}
+
+_cache = {}
+
+class ConfigError(ValueError):
+    """Raised when the configuration cannot be parsed in-process."""
+
+class Remote(object):
+    """A remote repository configured in ``remote.<name>.*``."""
+
+    def __init__(self, name, url=None, fetch=None):
+        self.name = name
+        self.url = url
+        self.fetch = fetch or []
+
+    def __repr__(self):
+        return '<Remote %s %s>' % (self.name, self.url)
+
+class Branch(object):
+    """The upstream tracking configuration of a branch in ``branch.<name>.*``."""
+
+    def __init__(self, name, remote=None, merge=None):
+        self.name = name
+        self.remote = remote
+        self.merge = merge
+
+    @property
+    def merge_branch(self):
+        """Name of the upstream branch without the refs/heads/ prefix."""
+        if self.merge is None:
+            return None
+        for prefix in ('refs/heads/', 'heads/'):
+            if self.merge.startswith(prefix):
+                return self.merge[len(prefix):]
+        return self.merge
+
+    def __repr__(self):
+        return '<Branch %s %s %s>' % (self.name, self.remote, self.merge)
+
+class Config(object):
+    """Parsed configuration entries."""
+
+    def __init__(self, entries=None):
+        # A list of (section, subsection, key, value) tuples in file order
+        self.entries = entries or []
+
+    def get_all(self, name):
+        """Returns all the values of ``name``, e.g. ``remote.origin.fetch``."""
+        section, subsection, key = split_name(name)
+        return [value for s, ss, k, value in self.entries
+                if (s, ss, k) == (section, subsection, key)]
+
+    def get(self, name, default=None):
+        """Returns the last value of ``name``."""
+        values = self.get_all(name)
+        if not values:
+            return default
+        return values[-1]
+
+    def remotes(self):
+        """Returns a mapping of remote names to ``Remote`` objects."""
+        remotes = {}
+        for section, subsection, key, value in self.entries:
+            if section == 'remote' and subsection is not None:
+                remote = remotes.setdefault(subsection, Remote(subsection))
+                if key == 'url':
+                    remote.url = value
+                elif key == 'fetch':
+                    remote.fetch.append(value)
+        return remotes
+
+    def branches(self):
+        """Returns a mapping of branch names to ``Branch`` objects."""
+        branches = {}
+        for section, subsection, key, value in self.entries:
+            if section == 'branch' and subsection is not None:
+                branch = branches.setdefault(subsection, Branch(subsection))
+                if key == 'remote':
+                    branch.remote = value
+                elif key == 'merge':
+                    branch.merge = value
+        return branches
+
+def split_name(name):
+    """Splits a variable name into a (section, subsection, key) tuple. The
+    section and key are case insensitive, the subsection is not.
+    """
+    first, last = name.find('.'), name.rfind('.')
+    if first < 0 or first == last:
+        return name[:first].lower(), None, name[first + 1:].lower()
+    return name[:first].lower(), name[first + 1:last], name[last + 1:].lower()
+
+def _parse_header(data, pos, filename):
+    """Parses a section header starting after the opening bracket at ``pos``.
+    Returns a tuple of (section, subsection, position after the header).
+    """
+    end = data.find(']', pos)
+    quote = data.find('"', pos)
+    if end < 0:
+        raise ConfigError('Bad section header in %s' % filename)
+    if quote < 0 or quote > end:
+        # [section] or the deprecated [section.subsection]
+        name = data[pos:end].strip().lower()
+        if '.' in name:
+            section, subsection = name.split('.', 1)
+            return section, subsection, end + 1
+        return name, None, end + 1
+
+    section = data[pos:quote].strip().lower()
+    subsection = []
+    pos = quote + 1
+    while pos < len(data) and data[pos] != '"':
+        if data[pos] == '\n':
+            raise ConfigError('Bad section header in %s' % filename)
+        if data[pos] == '\\':
+            pos += 1
+        subsection.append(data[pos:pos + 1])
+        pos += 1
+    if data[pos + 1:pos + 2] != ']':
+        raise ConfigError('Bad section header in %s' % filename)
+    return section, ''.join(subsection), pos + 2
+
+def _parse_value(data, pos, filename):
+    """Parses a value starting at ``pos``. Returns a tuple of (value, position
+    after the value).
+    """
+    value = []
+    quoted = False
+    spaces = 0
+    while pos < len(data):
+        c = data[pos]
+        pos += 1
+        if c == '\n':
+            if quoted:
+                raise ConfigError('Unterminated quote in %s' % filename)
+            break
+        if not quoted and c in ' \t\r':
+            if value:
+                spaces += 1
+            continue
+        if not quoted and c in '#;':
+            # A comment runs to the end of the line
+            newline = data.find('\n', pos)
+            pos = newline < 0 and len(data) or newline + 1
+            break
+        value.append(' ' * spaces)
+        spaces = 0
+        if c == '\\':
+            escaped = data[pos:pos + 1]
+            pos += 1
+            if escaped == '\n':
+                # Line continuation
+                continue
+            if escaped not in ESCAPES:
+                raise ConfigError('Bad escape sequence in %s' % filename)
+            value.append(ESCAPES[escaped])
+        elif c == '"':
+            quoted = not quoted
+        else:
+            value.append(c)
+    return ''.join(value), pos
+
+def parse(data, filename='<string>'):
+    """Returns a list of (section, subsection, key, value) tuples in the
+    configuration file contents ``data``. Keys without a value, which mean
+    boolean true, have None as their value.
+    """
+    entries = []
+    section = subsection = None
+    pos = 0
+    while pos < len(data):
+        c = data[pos]
+        if c in ' \t\r\n':
+            pos += 1
+        elif c in '#;':
+            newline = data.find('\n', pos)
+            pos = newline < 0 and len(data) or newline + 1
+        elif c == '[':
+            section, subsection, pos = _parse_header(data, pos + 1, filename)
+        elif c.isalpha():
+            if section is None:
+                raise ConfigError('Variable outside of a section in %s' % filename)
+            start = pos
+            while pos < len(data) and (data[pos].isalnum() or data[pos] == '-'):
+                pos += 1
+            key = data[start:pos].lower()
+            while pos < len(data) and data[pos] in ' \t':
+                pos += 1
+            if data[pos:pos + 1] == '=':
+                value, pos = _parse_value(data, pos + 1, filename)
+            elif pos >= len(data) or data[pos] in '\r\n#;':
+                value = None
+            else:
+                raise ConfigError('Bad config line in %s' % filename)
+            entries.append((section, subsection, key, value))
+        else:
+            raise ConfigError('Bad config line in %s' % filename)
+    return entries
+
+def _glob_matches(pattern, path, ignore_case=False):
+    """Matches ``path`` against an include condition pattern."""
+    if ignore_case:
+        pattern, path = pattern.lower(), path.lower()
+    return fnmatch.fnmatchcase(path, pattern)
+
+def _condition(condition, git_dir, filename):
+    """Evaluates the condition of an ``includeIf`` section."""
+    kind, pattern = condition.split(':', 1)
+    if kind in ('gitdir', 'gitdir/i'):
+        if pattern.startswith('~/'):
+            pattern = os.path.expanduser(pattern)
+        elif pattern.startswith('./'):
+            pattern = os.path.join(os.path.dirname(filename), pattern[2:])
+        elif not os.path.isabs(pattern):
+            pattern = '**/' + pattern
+        if pattern.endswith('/'):
+            pattern += '**'
+        path = os.path.realpath(git_dir)
+        return (_glob_matches(pattern, path, kind == 'gitdir/i') or
+                _glob_matches(pattern, path + '/', kind == 'gitdir/i'))
+    elif kind == 'onbranch':
+        if pattern.endswith('/'):
+            pattern += '**'
+        head = gitctl.refs.Refs(git_dir).symbolic('HEAD') or ''
+        return head.startswith('refs/heads/') and _glob_matches(pattern, head[len('refs/heads/'):])
+    raise ConfigError('Unsupported include condition: %s' % condition)
+
+def _read(filename, git_dir, files, depth=0):
+    """Reads the entries of ``filename`` and the files it includes. The
+    names of all files that were looked at are appended to ``files``.
+    """
+    if depth > MAX_INCLUDE_DEPTH:
+        raise ConfigError('Too deeply nested include files in %s' % filename)
+    files.append(filename)
+    try:
+        data = open(filename).read()
+    except IOError:
+        return []
+
+    entries = []
+    for section, subsection, key, value in parse(data, filename):
+        entries.append((section, subsection, key, value))
+        included = ((section == 'include' and subsection is None) or
+                    (section == 'includeif' and subsection is not None
+                     and _condition(subsection, git_dir, filename)))
+        if included and key == 'path' and value:
+            path = os.path.expanduser(value)
+            if not os.path.isabs(path):
+                path = os.path.join(os.path.dirname(filename), path)
+            entries.extend(_read(path, git_dir, files, depth + 1))
+    return entries
+
+def _signature(files):
+    """Returns a value that changes when any of ``files`` changes."""
+    signature = []
+    for filename in files:
+        try:
+            stat = os.stat(filename)
+            signature.append((filename, stat.st_mtime, stat.st_size, stat.st_ino))
+        except OSError:
+            signature.append((filename, None, None, None))
+    return signature
+
+def _is_true(value):
+    return value.lower() not in ('', '0', 'false', 'no', 'off')
+
+def config_files(git_dir):
+    """Returns the configuration files of the repository in ``git_dir`` in
+    the order git reads them, the later ones overriding the earlier ones.
+    """
+    files = []
+    if not _is_true(os.environ.get('GIT_CONFIG_NOSYSTEM', '')):
+        files.append(os.environ.get('GIT_CONFIG_SYSTEM', SYSTEM_CONFIG))
+    if 'GIT_CONFIG_GLOBAL' in os.environ:
+        files.append(os.environ['GIT_CONFIG_GLOBAL'])
+    else:
+        xdg = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser(os.path.join('~', '.config'))
+        files.append(os.path.join(xdg, 'git', 'config'))
+        files.append(os.path.expanduser(os.path.join('~', '.gitconfig')))
+    files.append(os.path.join(git_dir, 'config'))
+    return files
+
+def read(git_dir):
+    """Returns the ``Config`` of the repository in ``git_dir``, including
+    the system and global configuration.
+    """
+    filenames = tuple(config_files(git_dir))
+    cached = _cache.get(filenames)
+    if cached is not None and cached[0] == _signature([entry[0] for entry in cached[0]]):
+        return cached[1]
+
+    files = []
+    entries = []
+    for filename in filenames:
+        entries.extend(_read(filename, git_dir, files))
+    config = Config(entries)
+    _cache[filenames] = (_signature(files), config)
+    return config
+
+def repository_config(repository):
+    """Returns the ``Config`` of a ``git.Repo`` or ``git.Git`` object."""
+    git_dir = gitctl.refs.git_dir(repository)
+    if git_dir is None:
+        raise ConfigError('Cannot find the git directory of %s' % repository)
+    return read(git_dir)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Parallel ``git grep`` over several repositories.
+
+A fixed number of worker threads take the projects one at a time and run
+``git grep`` in them. The matching lines of all the projects are passed to
+the caller through a single queue as soon as git prints them, so the first
+results show up right away and a search with a limit stops all the running
+processes once enough lines have been found.
+"""
+import time
+import Queue
+import threading
+import subprocess
+
+import gitctl.tracing
+
+# Number of matching lines buffered ahead of the caller.
+QUEUE_SIZE = 256
+
+class Match(object):
+    """A matching line in a project."""
+
+    def __init__(self, project, path, lineno, line):
+        self.project = project
+        self.path = path
+        self.lineno = lineno
+        self.line = line
+
+    def __repr__(self):
+        return '<Match %s/%s:%d>' % (self.project, self.path, self.lineno)
+
+def command(pattern, revision, ignore_case=False, max_count=None):
+    """Returns the ``git grep`` command that searches ``revision``. The file
+    name, line number and line are separated with NUL characters.
+    """
+    command = ['git', 'grep', '--null', '--line-number', '-I']
+    if ignore_case:
+        command.append('--ignore-case')
+    if max_count:
+        # A single file can not contribute more than the whole result.
+        command.append('--max-count=%d' % max_count)
+    command.extend(['-e', pattern, revision, '--'])
+    return command
+
+def parse(project, revision, line):
+    """Parses a line of ``git grep --null --line-number`` output."""
+    path, lineno, text = line.rstrip('\n').split('\0', 2)
+    # The paths are prefixed with the revision that was searched.
+    if path.startswith(revision + ':'):
+        path = path[len(revision) + 1:]
+    return Match(project, path, int(lineno), text)
+
+class Search(object):
+    """Runs the ``git grep`` searches in ``jobs`` threads.
+
+    ``searches`` is a list of (project, revision, command, cwd) tuples.
+    """
+
+    def __init__(self, searches, jobs):
+        self.searches = Queue.Queue()
+        for search in searches:
+            self.searches.put(search)
+        self.jobs = max(1, min(jobs, len(searches)))
+        self.results = Queue.Queue(QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self.errors = {}
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def put(self, item):
+        """Puts ``item`` into the results unless the search is stopped while
+        waiting for room.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.results.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def run_one(self, project, revision, command, cwd):
+        start = time.time()
+        try:
+            process = subprocess.Popen(command, cwd=cwd,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError, x:
+            # E.g. a missing directory or too many open files
+            self.errors[project] = str(x)
+            return
+        self.lock.acquire()
+        try:
+            self.processes.add(process)
+        finally:
+            self.lock.release()
+        for line in iter(process.stdout.readline, ''):
+            if not self.put(parse(project, revision, line)):
+                process.terminate()
+                break
+        stderr = process.stderr.read()
+        status = process.wait()
+        self.lock.acquire()
+        try:
+            self.processes.discard(process)
+        finally:
+            self.lock.release()
+        # Exit status 1 means that nothing matched.
+        if status > 1 and not self.stopped.is_set():
+            self.errors[project] = stderr.strip()
+        if gitctl.tracing.ACTIVE is not None:
+            gitctl.tracing.ACTIVE.process('git', command, start, time.time() - start,
+                                          status, None, cwd=cwd)
+
+    def worker(self):
+        try:
+            while not self.stopped.is_set():
+                try:
+                    search = self.searches.get_nowait()
+                except Queue.Empty:
+                    break
+                self.run_one(*search)
+        finally:
+            self.put(None)
+
+    def matches(self, limit=None):
+        """Generates the matching lines in the order they are found. At most
+        ``limit`` lines are generated if it is given.
+        """
+        threads = [threading.Thread(target=self.worker, name='gitctl-grep-%d' % i)
+                   for i in range(self.jobs)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        running, count = len(threads), 0
+        try:
+            while running and (limit is None or count < limit):
+                match = self.results.get()
+                if match is None:
+                    running -= 1
+                    continue
+                yield match
+                count += 1
+        finally:
+            self.stopped.set()
+            # Searches that have not printed anything for a while would
+            # otherwise keep the threads waiting.
+            self.lock.acquire()
+            try:
+                for process in self.processes:
+                    try:
+                        process.terminate()
+                    except OSError:
+                        # Exited already
+                        pass
+            finally:
+                self.lock.release()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""History of how long the operations on each project take.
+
+The durations are used to start the projects expected to take the longest
+first when running in parallel (longest processing time first scheduling) so
+that a single large project started last does not determine the total time.
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+LOG = logging.getLogger('gitctl')
+
+# Weight of the latest duration in the average duration.
+SMOOTHING = 0.5
+
+class History(object):
+    """Average durations of operations per project, stored in ``filename``."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.durations = {}
+        self.lock = threading.Lock()
+        try:
+            self.durations = json.load(open(filename))
+        except (IOError, ValueError):
+            # No history yet or the file is broken; start over.
+            pass
+
+    def expected(self, operation, proj):
+        """Returns the expected duration of ``operation`` on ``proj`` in
+        seconds, or None if it is not known.
+        """
+        return self.durations.get(operation, {}).get(proj['name'])
+
+    def record(self, operation, proj, duration):
+        """Records a duration of ``operation`` on ``proj``."""
+        self.lock.acquire()
+        try:
+            durations = self.durations.setdefault(operation, {})
+            previous = durations.get(proj['name'])
+            if previous is not None:
+                duration = SMOOTHING * duration + (1 - SMOOTHING) * previous
+            durations[proj['name']] = duration
+        finally:
+            self.lock.release()
+
+    def timed(self, operation, func):
+        """Returns a wrapper of ``func(proj)`` that records its duration.
+        ``operation`` is the name of the operation or a function returning it
+        for a project.
+        """
+        def wrapper(proj):
+            name = callable(operation) and operation(proj) or operation
+            start = time.time()
+            result = func(proj)
+            self.record(name, proj, time.time() - start)
+            return result
+        return wrapper
+
+    def order(self, operation, projects, jobs):
+        """Returns the indices of ``projects`` with the longest expected
+        duration first. Projects without history are expected to be as slow
+        as the slowest known one. Returns None when the projects are
+        processed one at a time, as the order does not change the total time
+        then and the output can be shown as it is produced.
+        """
+        if jobs <= 1:
+            return None
+        expected = [self.expected(callable(operation) and operation(proj) or operation, proj)
+                    for proj in projects]
+        slowest = max([e for e in expected if e is not None] or [0])
+        for i, duration in enumerate(expected):
+            if duration is None:
+                expected[i] = slowest
+        # The sort is stable so the projects with equal durations stay in
+        # the normal project order.
+        return sorted(range(len(projects)), key=lambda i: -expected[i])
+
+    def save(self):
+        """Writes the history into the file."""
+        try:
+            directory = os.path.dirname(self.filename)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            temp = '%s.%d.tmp' % (self.filename, os.getpid())
+            out = open(temp, 'w')
+            try:
+                self.lock.acquire()
+                try:
+                    json.dump(self.durations, out, indent=1, sort_keys=True)
+                finally:
+                    self.lock.release()
+            finally:
+                out.close()
+            os.rename(temp, self.filename)
+        except (IOError, OSError), x:
+            # The history only affects the scheduling, not worth failing for.
+            LOG.warning('Could not save the operation history: %s', x)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Advisory locks that keep concurrent gitctl processes out of each other's
+way.
+
+A process that changes a project, e.g. ``gitctl update`` run from cron,
+holds the lock of that project while it works on it. Other processes that
+want to change the same project wait for it, while projects nobody else is
+working on are processed right away. Commands that only read the projects
+do not take the locks at all.
+
+The locks are ``flock`` locks, so they are released by the operating system
+if the process holding them dies.
+"""
+import os
+import time
+import errno
+import fcntl
+
+# Seconds between the attempts to take a lock held by another process.
+POLL_INTERVAL = 0.1
+
+class LockTimeout(Exception):
+    """Raised when a lock is not released in time by the process holding
+    it.
+    """
+
+    def __init__(self, filename, timeout):
+        super(LockTimeout, self).__init__(filename, timeout)
+        self.filename = filename
+        self.timeout = timeout
+
+    def __str__(self):
+        return 'Timed out after %ds waiting for the lock %s' % (self.timeout, self.filename)
+
+class Lock(object):
+    """An exclusive lock on the file ``filename``. Waits at most ``timeout``
+    seconds for the lock, or forever if it is None.
+    """
+
+    def __init__(self, filename, timeout=None):
+        self.filename = filename
+        self.timeout = timeout
+        self.file = None
+
+    def _try_lock(self):
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except IOError, x:
+            if x.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                raise
+            return False
+
+    def acquire(self, waiting=None):
+        """Takes the lock. ``waiting`` is called once if the lock is held by
+        someone else and we need to wait for it.
+        """
+        directory = os.path.dirname(self.filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        self.file = open(self.filename, 'a')
+        if self._try_lock():
+            return
+        if waiting is not None:
+            waiting()
+        start = time.time()
+        while not self._try_lock():
+            if self.timeout is not None and time.time() - start > self.timeout:
+                self.file.close()
+                self.file = None
+                raise LockTimeout(self.filename, self.timeout)
+            time.sleep(POLL_INTERVAL)
+
+    def release(self):
+        """Releases the lock."""
+        if self.file is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""A merged chronological log of several repositories.
+
+A producer runs for each repository in a thread of its own and feeds the
+commits into a small queue. The newest commits of all the queues are merged
+with a heap, so the first commits are shown as soon as every repository has
+produced its first one and the memory use does not depend on the length of
+the history.
+
+The producers read the log a page at a time, each page with a ``git log``
+process of its own, and only a limited number of them run ``git log`` at
+once. A producer waiting for room in its queue does not hold on to a
+process, so any number of repositories can be merged.
+"""
+import time
+import heapq
+import Queue
+import threading
+import subprocess
+
+import gitctl.tracing
+
+# The fields of a commit, separated with NUL characters.
+FORMAT = '%ct%x00%H%x00%an%x00%s'
+
+# Number of commits buffered for each repository.
+QUEUE_SIZE = 64
+
+# The first page of the log of a repository has QUEUE_SIZE commits and each
+# following one twice as many as the previous one, up to this many, so that
+# a long log needs few processes.
+MAX_PAGE_SIZE = 4096
+
+# Marks the end of the commits of a repository.
+END = None
+
+class Commit(object):
+    """A commit in the log of a project."""
+
+    def __init__(self, project, timestamp, sha1, author, subject):
+        self.project = project
+        self.timestamp = timestamp
+        self.sha1 = sha1
+        self.author = author
+        self.subject = subject
+
+    def __repr__(self):
+        return '<Commit %s %s>' % (self.project, self.sha1)
+
+def parse(project, line):
+    """Parses a line of ``git log --format=FORMAT`` output."""
+    timestamp, sha1, author, subject = line.rstrip('\n').split('\0', 3)
+    return Commit(project, int(timestamp), sha1, author, subject)
+
+class Producer(threading.Thread):
+    """Runs ``git log`` for a project and puts the commits into a queue.
+
+    ``command`` is the ``git log`` command without the ``--skip`` and
+    ``--max-count`` options of the pages, and ``limit`` the number of
+    commits to produce at most. ``git log`` only runs while the producer
+    holds one of the ``slots``.
+    """
+
+    def __init__(self, project, command, cwd, limit=None):
+        super(Producer, self).__init__(name='gitctl-log-%s' % project)
+        self.daemon = True
+        self.project = project
+        self.command = command
+        self.cwd = cwd
+        self.limit = limit
+        self.slots = threading.Semaphore()
+        self.queue = Queue.Queue(QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self.error = None
+
+    def put(self, item):
+        """Puts ``item`` into the queue unless the producer is stopped while
+        waiting for room.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def read(self, skip, count):
+        """Returns the lines of ``git log`` for ``count`` commits after the
+        first ``skip`` ones, or None if it fails.
+        """
+        command = self.command[:2] + ['--skip=%d' % skip, '--max-count=%d' % count] + \
+            self.command[2:]
+        self.slots.acquire()
+        try:
+            start = time.time()
+            process = subprocess.Popen(command, cwd=self.cwd,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = process.communicate()
+            if gitctl.tracing.ACTIVE is not None:
+                gitctl.tracing.ACTIVE.process('git', command, start, time.time() - start,
+                                              process.returncode, None, cwd=self.cwd)
+        finally:
+            self.slots.release()
+        if process.returncode != 0:
+            self.error = stderr.strip()
+            return None
+        return stdout.splitlines()
+
+    def run(self):
+        produced = 0
+        size = QUEUE_SIZE
+        try:
+            try:
+                while not self.stopped.is_set():
+                    if self.limit is not None:
+                        size = min(size, self.limit - produced)
+                    if size <= 0:
+                        break
+                    lines = self.read(produced, size)
+                    if lines is None:
+                        break
+                    for line in lines:
+                        if not self.put(parse(self.project, line)):
+                            return
+                    produced += len(lines)
+                    if len(lines) < size:
+                        break
+                    size = min(size * 2, MAX_PAGE_SIZE)
+            except OSError, x:
+                # E.g. a missing directory or too many open files
+                self.error = str(x)
+        finally:
+            self.put(END)
+
+    def stop(self):
+        self.stopped.set()
+
+def merge(producers, limit=None, jobs=None):
+    """Generates the commits of all the ``producers`` newest first. At most
+    ``limit`` commits are generated if it is given, and at most ``jobs``
+    ``git log`` processes run at once.
+    """
+    slots = threading.Semaphore(jobs or len(producers) or 1)
+    for producer in producers:
+        producer.slots = slots
+        producer.start()
+    heap = []
+    try:
+        for index, producer in enumerate(producers):
+            commit = producer.queue.get()
+            if commit is not END:
+                heap.append((-commit.timestamp, index, commit))
+        heapq.heapify(heap)
+
+        count = 0
+        while heap and (limit is None or count < limit):
+            timestamp, index, commit = heap[0]
+            yield commit
+            count += 1
+            following = producers[index].queue.get()
+            if following is END:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (-following.timestamp, index, following))
+    finally:
+        for producer in producers:
+            producer.stop()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Repository maintenance.
+
+Keeps the object database of the projects in a shape that makes the history
+queries of ``gitctl status`` and friends fast: loose objects are packed, the
+packs are covered by a multi-pack-index and the commit-graph is written so
+that ``git rev-list`` and ``git log`` do not need to parse the commits.
+"""
+import os
+import time
+import logging
+
+import git
+
+import gitctl.refs
+import gitctl.utils
+
+LOG = logging.getLogger('gitctl')
+
+# The loose objects are counted in a single fan-out directory and multiplied
+# by 256 to estimate the total, like ``git gc --auto`` does.
+LOOSE_OBJECT_SAMPLE = '17'
+
+def directory_size(path):
+    """Returns the total size of the files under ``path`` in bytes."""
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                # Removed while we were looking, e.g. by a concurrent repack
+                pass
+    return size
+
+def format_size(size):
+    """Returns a human readable representation of ``size`` bytes."""
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return unit == 'B' and '%d %s' % (size, unit) or '%.1f %s' % (size, unit)
+        size /= 1024.0
+    return '%.1f GiB' % size
+
+def object_stats(git_dir):
+    """Returns a dictionary with the estimated number of loose objects, the
+    number of packs and whether the commit-graph exists in the repository.
+    """
+    objects = os.path.join(git_dir, 'objects')
+    try:
+        loose = len(os.listdir(os.path.join(objects, LOOSE_OBJECT_SAMPLE))) * 256
+    except OSError:
+        loose = 0
+    try:
+        packs = len([name for name in os.listdir(os.path.join(objects, 'pack'))
+                     if name.endswith('.pack')])
+    except OSError:
+        packs = 0
+    commit_graph = (os.path.exists(os.path.join(objects, 'info', 'commit-graph')) or
+                    os.path.exists(os.path.join(objects, 'info', 'commit-graphs', 'commit-graph-chain')))
+    return {'loose-objects' : loose,
+            'packs' : packs,
+            'commit-graph' : commit_graph}
+
+def needs_maintenance(path, config):
+    """Returns True if the repository at ``path`` exceeds the maintenance
+    thresholds in the gitctl ``config``.
+    """
+    git_dir = gitctl.refs.find_git_dir(path)
+    if git_dir is None:
+        return False
+    stats = object_stats(git_dir)
+    return (stats['loose-objects'] > config['maintain-loose-objects'] or
+            stats['packs'] > config['maintain-packs'] or
+            not stats['commit-graph'])
+
+def steps(config, prune=True):
+    """Returns the maintenance steps as a list of git argument lists."""
+    commands = []
+    if prune:
+        # Remove remote branches that no longer exist upstream
+        commands.append(['remote', 'prune', config['upstream']])
+    commands.extend([
+        # Pack the loose objects into a new pack and remove them. Without -a
+        # the existing packs are left alone so this stays cheap.
+        ['repack', '-d', '-l', '-q'],
+        ['multi-pack-index', 'write', '--no-progress'],
+        # Drop packs whose objects are all found in other packs
+        ['multi-pack-index', 'expire', '--no-progress'],
+        # Add the new commits as an incremental layer of the commit-graph
+        ['commit-graph', 'write', '--reachable', '--split', '--no-progress'],
+        ])
+    return commands
+
+def maintain(path, config, prune=True):
+    """Runs the maintenance steps in the repository at ``path``. Returns a
+    dictionary with the elapsed time, the size of the object database before
+    and after and the steps that failed.
+
+    Pruning contacts the upstream, so it is subject to the ``timeout`` and
+    ``retries`` options like the other network calls.
+    """
+    git_dir = gitctl.refs.find_git_dir(path)
+    objects = os.path.join(git_dir, 'objects')
+    repository = git.Git(path)
+
+    result = {'size-before' : directory_size(objects), 'failed' : []}
+    start = time.time()
+    for command in steps(config, prune=prune):
+        if command[0] == 'remote':
+            try:
+                status, stdout, stderr = gitctl.utils.git_network(repository, config, *command,
+                                                                  with_extended_output=True,
+                                                                  with_exceptions=False)
+            except gitctl.utils.CommandTimeout, x:
+                # The local steps do not need the upstream.
+                result['failed'].append((' '.join(command), str(x)))
+                continue
+        else:
+            status, stdout, stderr = repository.execute(['git'] + command,
+                                                        with_extended_output=True,
+                                                        with_exceptions=False)
+        if status != 0:
+            result['failed'].append((' '.join(command), stderr.strip()))
+    result['time'] = time.time() - start
+    result['size-after'] = directory_size(objects)
+    result['reclaimed'] = result['size-before'] - result['size-after']
+    return result
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Scheduling of network operations.
+
+The projects are grouped by the host of their repository URL and only a
+limited number of fetches, pulls and clones run against each host at the
+same time. The limit adapts to how the host is doing: it is cut in half when
+a connection fails or the operations start to take much longer than usual,
+and grows back one step at a time while they succeed (additive increase,
+multiplicative decrease).
+"""
+import re
+import time
+import threading
+
+# Errors that mean the host could not be reached or gave up on us, as
+# opposed to errors in the repository itself.
+RE_CONNECTION_ERROR = re.compile('|'.join([
+    r'could not resolve host',
+    r'temporary failure in name resolution',
+    r'connection (refused|reset|timed out|closed)',
+    r'operation timed out',
+    r'ssh: connect to host',
+    r'kex_exchange_identification',
+    r'the remote end hung up unexpectedly',
+    r'early eof',
+    r'rpc failed',
+    r'http[ /]\d?\.?\d? ?(429|502|503|504)',
+    r'too many (connections|requests)',
+    ]), re.IGNORECASE)
+
+# An operation is considered slow when it takes this many times longer than
+# the average for the host.
+SLOW_FACTOR = 3.0
+# Number of operations needed before the average is trusted.
+MIN_SAMPLES = 3
+# Weight of the latest duration in the average.
+SMOOTHING = 0.3
+# Delay before trying a host again after a connection failure. Doubles with
+# each consecutive failure up to MAX_BACKOFF.
+BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+def url_host(url):
+    """Returns the host name in a git repository URL, or None for local
+    repositories.
+    """
+    if '://' in url:
+        scheme, rest = url.split('://', 1)
+        if scheme == 'file':
+            return None
+        netloc = rest.split('/', 1)[0].rsplit('@', 1)[-1]
+        if netloc.startswith('['):
+            # An IPv6 address
+            return netloc[1:netloc.find(']')].lower()
+        return netloc.split(':', 1)[0].lower() or None
+    colon, slash = url.find(':'), url.find('/')
+    if colon > 0 and (slash < 0 or colon < slash):
+        # The scp-like syntax, [user@]host:path
+        host = url[:colon].rsplit('@', 1)[-1]
+        if host.startswith('[') and host.endswith(']'):
+            host = host[1:-1]
+        return host.lower()
+    return None
+
+def project_host(proj, config):
+    """Returns the host the repository of ``proj`` lives on. Projects without
+    a URL are being created in ``upstream-url``.
+    """
+    return url_host(proj.get('url') or '%s:%s.git' % (config['upstream-url'], proj['name']))
+
+def is_connection_error(error):
+    """Returns True if ``error`` (an exception or the stderr of git) means
+    that the connection to the host failed.
+    """
+    # GitCommandError does not include the output of git in its message.
+    return RE_CONNECTION_ERROR.search(str(getattr(error, 'stderr', None) or error)) is not None
+
+class Host(object):
+    """The scheduling state of a single host."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.max_limit = limit
+        self.limit = float(limit)
+        self.running = 0
+        self.average = None
+        self.samples = 0
+        self.failures = 0
+        self.retry_at = 0
+
+    def __repr__(self):
+        return '<Host %s %d/%.1f>' % (self.name, self.running, self.limit)
+
+class Scheduler(object):
+    """Limits the number of concurrent network operations per host.
+
+    Used as the ``gate`` of ``gitctl.parallel.run``.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.hosts = {}
+        self.started = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def host(self, proj):
+        name = project_host(proj, self.config)
+        if name not in self.hosts:
+            limit = self.config['host-connections'].get(name, self.config['connections-per-host'])
+            self.hosts[name] = Host(name, limit)
+        return self.hosts[name]
+
+    def acquire(self, proj):
+        """Returns True if the operation for ``proj`` may start now."""
+        self.lock.acquire()
+        try:
+            host = self.host(proj)
+            if host.name is not None:
+                if time.time() < host.retry_at or host.running >= max(1, int(host.limit)):
+                    return False
+            host.running += 1
+            self.started[proj['name']] = time.time()
+            return True
+        finally:
+            self.lock.release()
+
+    def release(self, proj, error=None):
+        """Records that the operation for ``proj`` is done. ``error`` is the
+        exc_info of an exception raised by the operation, if any.
+        """
+        self.lock.acquire()
+        try:
+            host = self.host(proj)
+            host.running -= 1
+            duration = time.time() - self.started.pop(proj['name'])
+            reported = self.errors.pop(proj['name'], None)
+            if error is not None:
+                reported = error[1]
+            if reported is None:
+                self._record(host, duration)
+            elif is_connection_error(reported):
+                self._backoff(host)
+        finally:
+            self.lock.release()
+
+    def failed(self, proj, error):
+        """Records an error of the operation for ``proj`` that was handled by
+        the caller instead of raised.
+        """
+        self.lock.acquire()
+        try:
+            self.errors[proj['name']] = error
+        finally:
+            self.lock.release()
+
+    def _backoff(self, host):
+        host.failures += 1
+        host.limit = max(1.0, host.limit / 2)
+        host.retry_at = time.time() + min(MAX_BACKOFF, BACKOFF * 2 ** (host.failures - 1))
+
+    def _record(self, host, duration):
+        slow = host.samples >= MIN_SAMPLES and duration > SLOW_FACTOR * host.average
+        if host.average is None:
+            host.average = duration
+        else:
+            host.average = SMOOTHING * duration + (1 - SMOOTHING) * host.average
+        host.samples += 1
+        if slow:
+            host.limit = max(1.0, host.limit / 2)
+        else:
+            host.failures = 0
+            host.limit = min(host.max_limit, host.limit + 1.0 / host.limit)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""In-process lookup of objects in the object database.
+
+Answers whether a commit is available locally by looking at the loose
+objects and binary searching the pack indexes, without starting ``git
+cat-file``.
+"""
+import os
+import mmap
+import struct
+import binascii
+
+PACK_INDEX_SIGNATURE = '\377tOc'
+
+def object_directories(git_dir):
+    """Returns the object directory of the repository in ``git_dir`` followed
+    by its alternates.
+    """
+    objects = os.path.join(git_dir, 'objects')
+    directories = [objects]
+    try:
+        alternates = open(os.path.join(objects, 'info', 'alternates')).read().splitlines()
+    except IOError:
+        alternates = []
+    for line in alternates:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            directories.append(os.path.normpath(os.path.join(objects, line)))
+    return directories
+
+def search_pack_index(data, binsha):
+    """Returns True if the contents of a pack index ``data`` contain the
+    binary SHA1 ``binsha``.
+    """
+    if data[:4] == PACK_INDEX_SIGNATURE:
+        # Version 2: a header, the fan-out table and a table of the names
+        fanout, names, stride = 8, 8 + 256 * 4, 20
+        offset = 0
+    else:
+        # Version 1: the fan-out table and a table of (offset, name) entries
+        fanout, names, stride = 0, 256 * 4, 24
+        offset = 4
+    first = ord(binsha[0])
+    lo = first and struct.unpack('>I', data[fanout + (first - 1) * 4:fanout + first * 4])[0] or 0
+    hi = struct.unpack('>I', data[fanout + first * 4:fanout + (first + 1) * 4])[0]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = names + mid * stride + offset
+        name = data[start:start + 20]
+        if name == binsha:
+            return True
+        elif name < binsha:
+            lo = mid + 1
+        else:
+            hi = mid
+    return False
+
+def _pack_index_contains(filename, binsha):
+    try:
+        f = open(filename, 'rb')
+    except IOError:
+        return False
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size < 256 * 4:
+            return False
+        data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            return search_pack_index(data, binsha)
+        finally:
+            data.close()
+    finally:
+        f.close()
+
+def has_object(git_dir, sha1):
+    """Returns True if the object ``sha1`` is in the repository in
+    ``git_dir`` or its alternates.
+    """
+    sha1 = sha1.lower()
+    binsha = binascii.unhexlify(sha1)
+    for objects in object_directories(git_dir):
+        if os.path.exists(os.path.join(objects, sha1[:2], sha1[2:])):
+            return True
+        pack = os.path.join(objects, 'pack')
+        try:
+            names = os.listdir(pack)
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith('.idx') and _pack_index_contains(os.path.join(pack, name), binsha):
+                return True
+    return False
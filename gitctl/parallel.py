@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Running per-project work in parallel.
+
+The work for each project runs in a pool of threads. Git does the heavy
+lifting in subprocesses so threads are sufficient. The log messages of each
+project are held back and emitted in the normal project order so that the
+output looks the same as when the projects are processed one by one.
+"""
+import sys
+import logging
+import threading
+
+import gitctl.tracing
+
+LOG = logging.getLogger('gitctl')
+
+_local = threading.local()
+
+class BufferFilter(logging.Filter):
+    """Holds back the log records emitted by worker threads."""
+
+    def filter(self, record):
+        records = getattr(_local, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+LOG.addFilter(BufferFilter())
+
+class Pool(object):
+    """Runs a function for a list of projects in worker threads."""
+
+    # How often waiting threads wake up to check for interrupts and gates
+    # that opened up because of the passage of time.
+    poll_interval = 0.1
+
+    def __init__(self, func, projects, jobs, order=None, gate=None):
+        self.func = func
+        self.projects = projects
+        self.jobs = jobs
+        self.gate = gate
+        if order is None:
+            order = range(len(projects))
+        self.pending = list(order)
+        self.results = [None] * len(projects)
+        self.records = [[] for p in projects]
+        self.errors = [None] * len(projects)
+        self.done = [False] * len(projects)
+        self.failed = False
+        self.condition = threading.Condition()
+
+    def next_task(self):
+        """Returns the index of the next project to process, or None if there
+        is nothing more to do. Must be called with the condition held.
+        """
+        while not self.failed and self.pending:
+            for i, index in enumerate(self.pending):
+                if self.gate is None or self.gate.acquire(self.projects[index]):
+                    del self.pending[i]
+                    return index
+            self.condition.wait(self.poll_interval)
+        return None
+
+    def worker(self):
+        while True:
+            self.condition.acquire()
+            try:
+                index = self.next_task()
+            finally:
+                self.condition.release()
+            if index is None:
+                return
+
+            proj = self.projects[index]
+            _local.records = self.records[index]
+            error = None
+            try:
+                try:
+                    with gitctl.tracing.phase(proj['name'], project=proj['name']):
+                        self.results[index] = self.func(proj)
+                except Exception:
+                    error = self.errors[index] = sys.exc_info()
+            finally:
+                _local.records = None
+                if self.gate is not None:
+                    self.gate.release(proj, error)
+                self.condition.acquire()
+                try:
+                    self.done[index] = True
+                    if error is not None:
+                        self.failed = True
+                    self.condition.notify_all()
+                finally:
+                    self.condition.release()
+
+    def run(self):
+        threads = []
+        for i in range(min(self.jobs, len(self.projects))):
+            thread = threading.Thread(target=self.worker, name='gitctl-worker-%d' % i)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            # Emit the held back log records in project order.
+            for index in range(len(self.projects)):
+                self.condition.acquire()
+                try:
+                    while not self.done[index] and not (self.failed and index in self.pending):
+                        self.condition.wait(self.poll_interval)
+                finally:
+                    self.condition.release()
+                for record in self.records[index]:
+                    LOG.handle(record)
+        except KeyboardInterrupt:
+            self.failed = True
+            raise
+
+        for thread in threads:
+            thread.join()
+        for error in self.errors:
+            if error is not None:
+                raise error[0], error[1], error[2]
+        return self.results
+
+def run(func, projects, jobs=1, order=None, gate=None):
+    """Calls ``func(proj)`` for each of the ``projects`` using up to ``jobs``
+    threads and returns the results in project order.
+
+    ``order`` is an optional list of project indices giving the order in
+    which the projects are started. ``gate`` is an optional object whose
+    ``acquire(proj)`` method tells whether the work for a project may start
+    now and whose ``release(proj, error)`` method is called when it is done.
+
+    If one of the calls raises an exception no more projects are started and
+    the exception is raised again once the running calls have completed.
+    """
+    projects = list(projects)
+    if jobs <= 1 and gate is None and order is None:
+        results = []
+        for proj in projects:
+            with gitctl.tracing.phase(proj['name'], project=proj['name']):
+                results.append(func(proj))
+        return results
+    return Pool(func, projects, jobs, order=order, gate=gate).run()
@@ -22,8 +22,21 @@ parser.add_argument('--externals',
     help='Location of the externals configuration file. Defaults to '
          '$PWD/gitexternals.cfg')
 parser.add_argument('--verbose', action='store_true', help='Prints more verbose output about repositories.')
+parser.add_argument('--profile', metavar='FILE',
+    help='Records every git invocation and writes the trace to FILE in the '
+         'Chrome trace event format. A summary of the most expensive calls '
+         'is printed to stderr.')
+parser.add_argument('--profile-top', metavar='N', type=int,
+    help='Number of entries shown in each section of the profile summary. '
+         'Defaults to 10.')
+parser.add_argument('--jobs', '-j', metavar='N', type=int,
+    help='Number of projects processed in parallel by the commands that '
+         'support it. Defaults to the ``jobs`` option in gitctl.cfg or 1.')
 parser.set_defaults(
     verbose=False,
+    jobs=None,
+    profile=None,
+    profile_top=10,
     externals='gitexternals.cfg',
     config=[os.path.expanduser('~/.gitctl.cfg'),
             os.path.abspath('gitctl.cfg')])
@@ -34,9 +47,11 @@ cmd_parsers = parser.add_subparsers(help='Commands')
 
 # 'gitctl create'
 parser_create = cmd_parsers.add_parser('create',
-    help='Initializes a new local repository and creates a matching '
-         'upstream repository.')
-parser_create.add_argument('project', nargs=1, help='Name of the project')
+    help='Initializes new local repositories and creates the matching '
+         'upstream repositories.')
+parser_create.add_argument('project', nargs='+',
+    help='Path to a project directory. Any number of projects can be '
+         'created at once.')
 parser_create.add_argument('--message', '-m',
     help='Initial commit message. Defaults to "[gitctl] Project initialization.".')
 parser_create.set_defaults(
@@ -53,10 +68,43 @@ parser_update.add_argument('project', nargs='*',
 parser_update.add_argument('--from-file', '-f', 
     type=argparse.FileType('r'), default=None,
     help='the file with a list of projects')
+parser_update.add_argument('--locked', action='store_true',
+    help='Check out the revisions recorded in the lock file instead of '
+         'following the treeish of each project. Projects already at the '
+         'locked revision are left alone and the upstream is only contacted '
+         'when the revision is not available locally.')
+parser_update.add_argument('--fresh', action='store_true',
+    help='Fetch even if the project was fetched within the ``fetch-ttl`` '
+         'configured in gitctl.cfg.')
+parser_update.add_argument('--seed', metavar='DIR',
+    help='Clone the new projects from the local workspace or mirrors in DIR '
+         'by hardlinking their objects, and fetch only the rest from the '
+         'upstream.')
 parser_update.set_defaults(
+    locked=False,
+    fresh=False,
+    seed=None,
     func=gitctl.command.gitctl_update,
     )
 
+# 'gitctl lock'
+parser_lock = cmd_parsers.add_parser('lock',
+    help='Writes the lock file which pins each project to the revision its '
+         'treeish currently resolves to.')
+parser_lock.add_argument('project', nargs='*',
+    help='Name of a project to lock. If omitted all projects in the '
+         'externals configuration will be locked.')
+parser_lock.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_lock.add_argument('--verify', action='store_true',
+    help='Verifies that the projects are checked out at the locked revisions '
+         'instead of writing the lock file.')
+parser_lock.set_defaults(
+    verify=False,
+    read_only=True,
+    func=gitctl.command.gitctl_lock)
+
 # 'gitctl path'
 parser_path = cmd_parsers.add_parser('path',
     help='Shows the path to the project directory.')
@@ -68,6 +116,7 @@ parser_path.add_argument('--from-file', '-f',
     type=argparse.FileType('r'), default=None,
     help='the file with a list of projects')
 parser_path.set_defaults(
+    read_only=True,
     func=gitctl.command.gitctl_path,
     )
 
@@ -93,6 +142,9 @@ parser_status = cmd_parsers.add_parser('status',
 parser_status.add_argument('--no-fetch', action='store_true',
     help='Check the status without fetching from upstream first. This is '
          'faster, but may be unreliable if the remote branches are out-of-sync.')
+parser_status.add_argument('--fresh', action='store_true',
+    help='Fetch even if the project was fetched within the ``fetch-ttl`` '
+         'configured in gitctl.cfg.')
 parser_status.add_argument('--all-branches', action='store_true',
     help='Show all branches status, not only the development, staging and production.')
 parser_status.add_argument('project', nargs='*',
@@ -104,10 +156,12 @@ parser_status.add_argument('--from-file', '-f',
 parser_status.add_argument('--commits', action='store_true', help='Displays a summary of the commits that differ a branch from another')
 parser_status.add_argument('--limit', type=int, help='Limits the number of commits shown in the summary. Ignored with --commits.')
 parser_status.set_defaults(
+    read_only=True,
     func=gitctl.command.gitctl_status,
     commits=False,
     limit=-1,
-    no_fetch=False)
+    no_fetch=False,
+    fresh=False)
 
 # 'gitctl branch'
 parser_branch = cmd_parsers.add_parser('branch',
@@ -138,12 +192,17 @@ parser_pending.add_argument('--show-config', action='store_true',
 parser_pending.add_argument('--no-fetch', action='store_true',
     help='Do not fetch before checking changes. This is '
          'faster, but may be unreliable if the remote branches are out-of-sync.')
+parser_pending.add_argument('--fresh', action='store_true',
+    help='Fetch even if the project was fetched within the ``fetch-ttl`` '
+         'configured in gitctl.cfg.')
 parser_pending.add_argument('--from-file', '-f', 
     type=argparse.FileType('r'), default=None,
     help='the file with a list of projects')
 parser_pending.set_defaults(
     show_config=False,
     no_fetch=False,
+    fresh=False,
+    read_only=True,
     func=gitctl.command.gitctl_pending)
 
 # 'gitctl fetch'
@@ -157,4 +216,179 @@ parser_fetch.add_argument('--from-file', '-f',
     help='the file with a list of projects')
 parser_fetch.set_defaults(func=gitctl.command.gitctl_fetch)
 
+# 'gitctl prefetch'
+parser_prefetch = cmd_parsers.add_parser('prefetch',
+    help='Downloads the new objects of all projects without changing the '
+         'remote branches, e.g. from cron, so that later fetches are fast.')
+parser_prefetch.add_argument('project', nargs='*',
+    help='Name of a project to prefetch. If omitted all projects in the '
+         'externals configuration will be prefetched.')
+parser_prefetch.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_prefetch.set_defaults(func=gitctl.command.gitctl_prefetch)
+
+# 'gitctl maintain'
+parser_maintain = cmd_parsers.add_parser('maintain',
+    help='Packs the repositories and writes the commit-graph and '
+         'multi-pack-index to speed up history queries.')
+parser_maintain.add_argument('project', nargs='*',
+    help='Name of a project to maintain. If omitted all projects in the '
+         'externals configuration will be maintained.')
+parser_maintain.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_maintain.add_argument('--no-prune', action='store_true',
+    help='Do not remove the remote branches that no longer exist upstream. '
+         'Pruning contacts the upstream repository.')
+parser_maintain.set_defaults(
+    no_prune=False,
+    func=gitctl.command.gitctl_maintain)
+
+# 'gitctl log'
+parser_log = cmd_parsers.add_parser('log',
+    help='Shows the commits of all projects as a single log, newest first.')
+parser_log.add_argument('project', nargs='*',
+    help='Name of a project to include. If omitted all projects in the '
+         'externals configuration will be included.')
+parser_log.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_log.add_argument('--branch', '-b',
+    choices=['development', 'staging', 'production'],
+    help='Which of the configured branches to show. Defaults to the '
+         'development branch.')
+parser_log.add_argument('--since', metavar='DATE',
+    help='Show only commits more recent than DATE, e.g. "2 weeks ago".')
+parser_log.add_argument('--max-count', '-n', type=int, metavar='N',
+    help='Show only the N most recent commits.')
+parser_log.set_defaults(
+    branch='development',
+    since=None,
+    max_count=None,
+    read_only=True,
+    func=gitctl.command.gitctl_log)
+
+# 'gitctl grep'
+parser_grep = cmd_parsers.add_parser('grep',
+    help='Searches the projects for lines matching a pattern.')
+parser_grep.add_argument('pattern',
+    help='The regular expression to search for.')
+parser_grep.add_argument('project', nargs='*',
+    help='Name of a project to search. If omitted all projects in the '
+         'externals configuration will be searched.')
+parser_grep.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_grep.add_argument('--branch', '-b',
+    choices=['development', 'staging', 'production'],
+    help='Search the given configured branch instead of the treeish in the '
+         'externals configuration.')
+parser_grep.add_argument('--ignore-case', '-i', action='store_true',
+    help='Ignore case differences between the pattern and the files.')
+parser_grep.add_argument('--max-count', '-m', type=int, metavar='N',
+    help='Stop after N matching lines.')
+parser_grep.set_defaults(
+    branch=None,
+    ignore_case=False,
+    max_count=None,
+    read_only=True,
+    func=gitctl.command.gitctl_grep)
+
+# 'gitctl dedupe'
+parser_dedupe = cmd_parsers.add_parser('dedupe',
+    help='Moves the objects shared by projects with overlapping history into '
+         'a shared pool repository.')
+parser_dedupe.add_argument('project', nargs='*',
+    help='Name of a project to deduplicate. If omitted all projects in the '
+         'externals configuration will be deduplicated.')
+parser_dedupe.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_dedupe.set_defaults(
+    func=gitctl.command.gitctl_dedupe)
+
+# 'gitctl push'
+parser_push = cmd_parsers.add_parser('push',
+    help='Pushes the configured branches that are ahead of the upstream '
+         'repository.')
+parser_push.add_argument('project', nargs='*',
+    help='Name of a project to push. If omitted all projects in the '
+         'externals configuration will be pushed.')
+parser_push.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_push.add_argument('--dry-run', '-n', action='store_true',
+    help='Only show the branches that would be pushed.')
+parser_push.set_defaults(
+    dry_run=False,
+    func=gitctl.command.gitctl_push)
+
+# 'gitctl promote'
+parser_promote = cmd_parsers.add_parser('promote',
+    help='Fast-forwards the upstream staging or production branches to the '
+         'previous branch in the workflow.')
+parser_promote.add_argument('project', nargs='*',
+    help='Name of a project to promote. If omitted all projects in the '
+         'externals configuration will be promoted.')
+parser_promote.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_promote.add_argument('--to', '-t',
+    choices=['staging', 'production'],
+    help='The branch to promote to. The staging branch is promoted from the '
+         'development branch and the production branch from the staging '
+         'branch. Defaults to staging.')
+parser_promote.add_argument('--dry-run', '-n', action='store_true',
+    help='Only show what would be promoted.')
+parser_promote.add_argument('--no-fetch', action='store_true',
+    help='Do not fetch before checking the branches.')
+parser_promote.add_argument('--show-config', action='store_true',
+    help='Prints a new externals configuration to stdout that pins each '
+         'project to the promoted revision.')
+parser_promote.set_defaults(
+    to='staging',
+    dry_run=False,
+    no_fetch=False,
+    show_config=False,
+    func=gitctl.command.gitctl_promote)
+
+# 'gitctl bundle'
+parser_bundle = cmd_parsers.add_parser('bundle',
+    help='Writes a snapshot of the projects as git bundles, e.g. to seed '
+         'new workspaces or to move the projects to machines without access '
+         'to the upstream repositories.')
+parser_bundle.add_argument('output',
+    help='The directory to write the bundles to, or the file to write with '
+         '--combined.')
+parser_bundle.add_argument('project', nargs='*',
+    help='Name of a project to bundle. If omitted all projects in the '
+         'externals configuration will be bundled.')
+parser_bundle.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_bundle.add_argument('--since', metavar='SNAPSHOT',
+    help='Bundle only what has changed since the previous snapshot SNAPSHOT.')
+parser_bundle.add_argument('--combined', action='store_true',
+    help='Write the snapshot as a single file instead of a directory.')
+parser_bundle.set_defaults(
+    since=None,
+    combined=False,
+    func=gitctl.command.gitctl_bundle)
+
+# 'gitctl unbundle'
+parser_unbundle = cmd_parsers.add_parser('unbundle',
+    help='Clones or updates the projects from a snapshot written by '
+         '``gitctl bundle``.')
+parser_unbundle.add_argument('snapshot',
+    help='The snapshot directory or file.')
+parser_unbundle.add_argument('project', nargs='*',
+    help='Name of a project to unbundle. If omitted all projects in the '
+         'externals configuration will be unbundled.')
+parser_unbundle.add_argument('--from-file', '-f',
+    type=argparse.FileType('r'), default=None,
+    help='the file with a list of projects')
+parser_unbundle.set_defaults(
+    func=gitctl.command.gitctl_unbundle)
+
 __all__ = ['parser']
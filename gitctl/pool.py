@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Shared object pools.
+
+Projects that share history, e.g. forks of the same upstream, keep a full
+copy of the same objects each. The objects can be moved into a pool
+repository that the clones borrow from through ``objects/info/alternates``,
+so that each clone only keeps the objects it does not share.
+
+Every ref of every clone is fetched into the pool under
+``refs/projects/<name>/`` so that the pool never considers an object that a
+clone needs unreachable, and a clone is only repacked after checking that
+the pool has all of its refs.
+"""
+import os
+import time
+
+import git
+
+import gitctl.refs
+import gitctl.objects
+import gitctl.maintenance
+
+def root_commits(path):
+    """Returns the set of root commits reachable from the refs of the
+    repository at ``path``.
+    """
+    output = git.Git(path).rev_list('--max-parents=0', '--all', with_exceptions=False)
+    return set(output.split())
+
+def overlapping(projects, roots):
+    """Groups the ``projects`` that share a root commit. ``roots`` maps the
+    project names to their root commits. Returns a list of groups of at
+    least two projects, in the order of the projects.
+    """
+    group_of = {}
+    groups = []
+    for proj in projects:
+        # All the earlier groups that share a root with the project are
+        # merged into one.
+        found = []
+        for root in roots[proj['name']]:
+            if root in group_of and group_of[root] not in found:
+                found.append(group_of[root])
+        if found:
+            group = found[0]
+            for other in found[1:]:
+                group.extend(other)
+                groups.remove(other)
+        else:
+            group = []
+            groups.append(group)
+        group.append(proj)
+        for member in group:
+            for root in roots[member['name']]:
+                group_of[root] = group
+    order = dict((proj['name'], i) for i, proj in enumerate(projects))
+    return [sorted(group, key=lambda proj: order[proj['name']])
+            for group in groups if len(group) > 1]
+
+def pool_name(group, roots):
+    """Returns the name of the pool of a ``group`` of projects."""
+    return min(min(roots[proj['name']]) for proj in group)
+
+# The clones borrow objects that only their own reflogs or old refs reach,
+# so git must never drop anything from a pool, e.g. in the ``gc --auto`` of
+# a fetch.
+PRECIOUS = [('gc.auto', '0'),
+            ('gc.pruneExpire', 'never'),
+            ('core.repositoryFormatVersion', '1'),
+            ('extensions.preciousObjects', 'true')]
+
+def create(path):
+    """Creates the pool repository at ``path`` unless it exists, and makes
+    sure that git never removes objects from it.
+    """
+    if not os.path.isdir(os.path.join(path, 'objects')):
+        os.makedirs(path)
+        git.Git(path).init('--bare', '--quiet')
+    # Also for the pools made before the settings were added
+    pool = git.Git(path)
+    for key, value in PRECIOUS:
+        pool.config(key, value)
+
+def _execute(path, command):
+    return git.Git(path).execute(['git'] + command, with_extended_output=True,
+                                 with_exceptions=False)
+
+def add(pool, name, git_dir):
+    """Fetches all the refs of the repository in ``git_dir`` into the
+    ``pool`` under ``refs/projects/<name>/``. Returns the stderr of git on
+    failure, None otherwise.
+    """
+    status, stdout, stderr = _execute(pool, [
+        'fetch', '--quiet', '--no-tags', git_dir,
+        '+refs/*:refs/projects/%s/*' % name,
+        '+HEAD:refs/projects/%s/HEAD' % name])
+    if status != 0:
+        return stderr.strip()
+    return None
+
+def missing(pool, path):
+    """Returns the refs of the repository at ``path`` that point to objects
+    the ``pool`` does not have.
+    """
+    repository = git.Git(path)
+    refs = [(name, sha1) for sha1, name in gitctl.refs.show_ref(repository)]
+    refs.append(('HEAD', gitctl.refs.rev_parse(repository, 'HEAD')))
+    return [name for name, sha1 in refs if not gitctl.objects.has_object(pool, sha1)]
+
+def alternates(git_dir):
+    """Returns the lines of the alternates file of the repository in
+    ``git_dir``.
+    """
+    try:
+        return open(os.path.join(git_dir, 'objects', 'info', 'alternates')).read().splitlines()
+    except IOError:
+        return []
+
+def _write_alternates(git_dir, lines):
+    filename = os.path.join(git_dir, 'objects', 'info', 'alternates')
+    if not lines:
+        if os.path.exists(filename):
+            os.remove(filename)
+        return
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    out = open(filename, 'w')
+    try:
+        out.write(''.join('%s\n' % line for line in lines))
+    finally:
+        out.close()
+
+def check(path):
+    """Checks that all objects reachable in the repository at ``path`` are
+    available. Returns the errors of ``git fsck`` or None.
+    """
+    status, stdout, stderr = _execute(path, ['fsck', '--connectivity-only', '--no-progress',
+                                             '--no-dangling'])
+    if status != 0:
+        return stderr.strip() or stdout.strip()
+    return None
+
+def dedupe(pool, path):
+    """Makes the repository at ``path`` borrow the objects in ``pool`` and
+    drops its own copies of them. Returns a dictionary like
+    ``gitctl.maintenance.maintain`` with the additional ``error`` key, which
+    is set if the repository was left alone or reverted.
+    """
+    git_dir = gitctl.refs.find_git_dir(path)
+    objects = os.path.join(git_dir, 'objects')
+    pool_objects = os.path.join(os.path.abspath(pool), 'objects')
+    result = {'size-before' : gitctl.maintenance.directory_size(objects),
+              'error' : None}
+    start = time.time()
+
+    lost = missing(pool, path)
+    if lost:
+        result['error'] = 'The pool is missing %s, left alone' % ', '.join(lost)
+    else:
+        previous = alternates(git_dir)
+        if pool_objects not in previous:
+            _write_alternates(git_dir, previous + [pool_objects])
+        # -l leaves out the objects found in the pool.
+        status, stdout, stderr = _execute(path, ['repack', '-a', '-d', '-l', '-q'])
+        error = status != 0 and stderr.strip() or check(path)
+        if error:
+            # Copy the borrowed objects back before dropping the pool.
+            _execute(path, ['repack', '-a', '-d', '-q'])
+            _write_alternates(git_dir, [line for line in previous if line != pool_objects])
+            result['error'] = 'Reverted: %s' % error
+
+    result['time'] = time.time() - start
+    result['size-after'] = gitctl.maintenance.directory_size(objects)
+    result['reclaimed'] = result['size-before'] - result['size-after']
+    return result
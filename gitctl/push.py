@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Pushing the configured branches of the projects.
+
+Only the branches that have commits their upstream counterparts do not have
+are pushed, all of them in a single atomic ``git push`` per project: either
+every branch of the project is updated or none is.
+"""
+import gitctl.wtf
+
+# The flag of ``git push --porcelain`` for refs that were not updated.
+REJECTED = '!'
+
+class Update(object):
+    """The result of pushing a single ref, as reported by ``git push
+    --porcelain``.
+    """
+
+    def __init__(self, flag, source, destination, summary):
+        self.flag = flag
+        self.source = source
+        self.destination = destination
+        self.summary = summary
+
+    @property
+    def rejected(self):
+        return self.flag == REJECTED
+
+    @property
+    def branch(self):
+        return self.destination.replace('refs/heads/', '', 1)
+
+    @property
+    def reason(self):
+        """The reason git gave for rejecting the ref, e.g.
+        ``non-fast-forward``.
+        """
+        if '(' in self.summary:
+            return self.summary[self.summary.index('(') + 1:].rstrip(')')
+        return self.summary.strip('[]')
+
+def ahead(repository, config):
+    """Returns a list of (branch, commits) tuples of the configured branches
+    that are ahead of their counterparts in the upstream repository. The
+    branches the upstream repository does not have yet are left out.
+    """
+    structure = gitctl.wtf.branch_structure(repository)
+    remote_branches = set(info['remote_branch'] for info in structure.values()
+                          if 'remote_branch' in info)
+    result = []
+    for remote_branch, branch in config['branches']:
+        info = structure.get(branch, {})
+        if 'local_branch' not in info or remote_branch not in remote_branches:
+            continue
+        commits = gitctl.wtf.commits_between(repository, remote_branch, info['local_branch'],
+                                             verbose=False)
+        if commits:
+            result.append((branch, commits))
+    return result
+
+def command(upstream, branches):
+    """Returns the arguments of ``git push`` for the ``branches``."""
+    return ['push', '--atomic', '--porcelain', upstream] + [
+        'refs/heads/%s:refs/heads/%s' % (branch, branch) for branch in branches]
+
+def parse(output):
+    """Parses the output of ``git push --porcelain`` into a list of
+    ``Update`` objects.
+    """
+    updates = []
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if len(fields) != 3 or len(fields[0]) != 1 or ':' not in fields[1]:
+            continue
+        source, destination = fields[1].split(':', 1)
+        updates.append(Update(fields[0], source, destination, fields[2]))
+    return updates
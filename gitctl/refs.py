@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""In-process reading of git refs.
+
+Resolves ``HEAD``, loose refs and the ``packed-refs`` file directly from the
+git directory so that read-only questions do not need to start a git
+process. Anything that cannot be answered from the files (revision
+expressions, reftable repositories, worktrees, ...) falls back to git.
+"""
+import os
+import re
+import mmap
+
+import git
+
+RE_SHA1 = re.compile(r'^[0-9a-f]{40}$')
+RE_PSEUDO_REF = re.compile(r'^[A-Z_]+$')
+# Characters that make a name a revision expression rather than a ref name.
+RE_REVISION_SYNTAX = re.compile(r'\.\.|[~^:?*\[\\\s]|@\{')
+
+# Maximum depth of symbolic ref chains.
+MAX_SYMREF_DEPTH = 5
+
+def find_git_dir(path):
+    """Returns the git directory of the working directory or bare repository
+    at ``path``, or None if it cannot be determined.
+    """
+    dot_git = os.path.join(path, '.git')
+    if os.path.isdir(dot_git):
+        return dot_git
+    if os.path.isfile(dot_git):
+        # A gitfile pointing to the real git directory
+        data = open(dot_git).read().strip()
+        if data.startswith('gitdir: '):
+            return os.path.normpath(os.path.join(path, data[len('gitdir: '):]))
+        return None
+    if os.path.isfile(os.path.join(path, 'HEAD')) and os.path.isdir(os.path.join(path, 'objects')):
+        return path
+    return None
+
+def _read_file(path):
+    """Returns the stripped contents of ``path`` or None if it does not exist."""
+    try:
+        f = open(path)
+    except IOError:
+        return None
+    try:
+        return f.read().strip()
+    finally:
+        f.close()
+
+def _packed_record(data, start):
+    """Returns a tuple of (refname, sha1, start of the next record) for the
+    packed-refs record at ``start``.
+    """
+    end = data.find('\n', start)
+    if end < 0:
+        end = len(data)
+    line = data[start:end]
+    following = end + 1
+    # Skip the peeled value of an annotated tag
+    if data[following:following + 1] == '^':
+        following = data.find('\n', following)
+        following = following < 0 and len(data) or following + 1
+    return line[41:].rstrip('\r'), line[:40], following
+
+def search_packed_refs(data, name):
+    """Returns the SHA1 of ``name`` by a binary search over the contents of a
+    sorted packed-refs file, or None if ``name`` is not there.
+    """
+    lo, hi = 0, len(data)
+    if data[:1] == '#':
+        lo = data.find('\n') + 1 or hi
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = data.rfind('\n', lo, mid)
+        start = start < 0 and lo or start + 1
+        if data[start:start + 1] == '^':
+            # A peeled line belongs to the record on the previous line.
+            start = data.rfind('\n', lo, start - 1)
+            start = start < 0 and lo or start + 1
+        refname, sha1, following = _packed_record(data, start)
+        if refname == name:
+            return sha1
+        elif refname < name:
+            lo = following
+        else:
+            hi = start
+    return None
+
+def parse_packed_refs(data):
+    """Returns a list of (refname, sha1) tuples in a packed-refs file."""
+    refs = []
+    for line in data.splitlines():
+        if line.startswith('#') or line.startswith('^') or len(line) < 42:
+            continue
+        refs.append((line[41:], line[:40]))
+    return refs
+
+class Refs(object):
+    """Reads the refs of the repository in ``git_dir``."""
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.supported = (git_dir is not None
+                          and os.path.isfile(os.path.join(git_dir, 'HEAD'))
+                          and not os.path.exists(os.path.join(git_dir, 'commondir'))
+                          and not os.path.exists(os.path.join(git_dir, 'reftable')))
+
+    def packed(self, name):
+        """Returns the SHA1 of ``name`` in the packed-refs file."""
+        path = os.path.join(self.git_dir, 'packed-refs')
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return None
+            data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            try:
+                header = data[:data.find('\n') + 1]
+                if header.startswith('#') and ' sorted' in header:
+                    return search_packed_refs(data, name)
+                return dict(parse_packed_refs(data[:])).get(name)
+            finally:
+                data.close()
+        finally:
+            f.close()
+
+    def symbolic(self, name):
+        """Returns the target of the symbolic ref ``name`` or None if ``name``
+        is not a symbolic ref.
+        """
+        value = _read_file(os.path.join(self.git_dir, name))
+        if value is not None and value.startswith('ref: '):
+            return value[len('ref: '):]
+        return None
+
+    def read(self, name):
+        """Returns the SHA1 the full ref ``name`` points to or None if it
+        does not exist.
+        """
+        for i in range(MAX_SYMREF_DEPTH):
+            value = _read_file(os.path.join(self.git_dir, name))
+            if value is None or value == '':
+                return self.packed(name)
+            if value.startswith('ref: '):
+                name = value[len('ref: '):]
+                continue
+            return RE_SHA1.match(value) is not None and value or None
+        return None
+
+    def resolve(self, name):
+        """Returns the SHA1 of the (possibly abbreviated) ref ``name`` using
+        the same lookup rules as ``git rev-parse``, or None if the name cannot
+        be resolved from the files.
+        """
+        if RE_SHA1.match(name.lower()) is not None:
+            return name.lower()
+        if not self.supported or RE_REVISION_SYNTAX.search(name) is not None:
+            return None
+        candidates = ['refs/%s', 'refs/tags/%s', 'refs/heads/%s',
+                      'refs/remotes/%s', 'refs/remotes/%s/HEAD']
+        if name.startswith('refs/') or RE_PSEUDO_REF.match(name) is not None:
+            candidates.insert(0, '%s')
+        for pattern in candidates:
+            sha1 = self.read(pattern % name)
+            if sha1 is not None:
+                return sha1
+        return None
+
+    def list(self, prefix='refs/'):
+        """Returns a sorted list of (refname, sha1) tuples of the refs under
+        ``prefix``. Symbolic refs are resolved.
+        """
+        refs = {}
+        packed = _read_file(os.path.join(self.git_dir, 'packed-refs'))
+        if packed:
+            refs.update((name, sha1) for name, sha1 in parse_packed_refs(packed)
+                        if name.startswith(prefix))
+
+        root = os.path.join(self.git_dir, 'refs')
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith('.lock'):
+                    continue
+                name = 'refs/' + os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    sha1 = self.read(name)
+                    if sha1 is not None:
+                        refs[name] = sha1
+        return sorted(refs.items())
+
+def git_dir(repository):
+    """Returns the git directory of a ``git.Repo`` or ``git.Git`` object."""
+    if isinstance(repository, git.Repo):
+        return repository.path
+    return find_git_dir(repository.git_dir)
+
+def refs(repository):
+    """Returns the ``Refs`` reader for a ``git.Repo`` or ``git.Git`` object."""
+    return Refs(git_dir(repository))
+
+def _git(repository):
+    if isinstance(repository, git.Repo):
+        return repository.git
+    return repository
+
+def rev_parse(repository, name):
+    """Returns the SHA1 of ``name`` in ``repository``. The name is resolved
+    in-process if possible and with ``git rev-parse`` otherwise.
+    """
+    sha1 = refs(repository).resolve(name)
+    if sha1 is None:
+        sha1 = _git(repository).rev_parse(name).strip()
+    return sha1
+
+def active_branch(repository):
+    """Returns the name of the checked out branch of ``repository``."""
+    reader = refs(repository)
+    if reader.supported:
+        target = reader.symbolic('HEAD')
+        if target is not None and target.startswith('refs/heads/'):
+            return target[len('refs/heads/'):]
+    return _git(repository).symbolic_ref('HEAD').strip()[len('refs/heads/'):]
+
+def show_ref(repository):
+    """Returns a list of (sha1, refname) tuples of the branches and tags in
+    ``repository`` like ``git show-ref`` does.
+    """
+    reader = refs(repository)
+    if reader.supported:
+        return [(sha1, name) for name, sha1 in reader.list()]
+    return [tuple(line.split(' ', 1))
+            for line in _git(repository).show_ref(with_exceptions=False).splitlines()
+            if line.strip()]
+
+def branches(repository, remote=False):
+    """Returns the set of local branch names in ``repository``, or the remote
+    branch names in the <remote>/<branch> form if ``remote`` is True.
+    """
+    prefix = remote and 'refs/remotes/' or 'refs/heads/'
+    return set(name[len(prefix):] for sha1, name in show_ref(repository)
+               if name.startswith(prefix))
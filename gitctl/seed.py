@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Cloning projects from a local seed.
+
+A seed is another workspace or a directory of mirrors on the same machine,
+e.g. a warm workspace on a CI host. Cloning from it hardlinks the objects
+instead of copying them, and only what the seed does not have is fetched
+from the upstream afterwards.
+"""
+import os
+
+import git
+
+import gitctl.refs
+import gitctl.utils
+
+def find(proj, seed, workspace):
+    """Returns the path of the repository of ``proj`` in the ``seed``
+    directory, or None if the seed does not have it. ``workspace`` is the
+    directory of the externals configuration.
+
+    The seed can be a workspace with the same layout, a container of clones
+    or a directory of ``<name>.git`` mirrors.
+    """
+    path = gitctl.utils.project_path(proj)
+    candidates = [os.path.join(seed, os.path.relpath(path, workspace)),
+                  os.path.join(seed, proj['name']),
+                  os.path.join(seed, '%s.git' % proj['name'])]
+    for candidate in candidates:
+        if os.path.isdir(candidate) and gitctl.refs.find_git_dir(candidate) is not None:
+            return os.path.abspath(candidate)
+    return None
+
+def clone(source, path, config, url):
+    """Clones the repository at ``source`` to ``path`` by hardlinking its
+    objects and points the upstream remote to ``url``. The remote branches
+    are set to the upstream branches as the seed knows them, and nothing is
+    checked out.
+    """
+    git.Git(os.path.dirname(path)).clone('--local', '--no-checkout', '--quiet',
+                                          '--origin', config['upstream'], source, path)
+    repository = git.Git(path)
+    upstream = config['upstream']
+    # The refs of the seed are what the upstream had when it was last
+    # fetched, not its own branches that clone maps to the remote branches.
+    for sha1, name in gitctl.refs.show_ref(repository):
+        repository.update_ref('--no-deref', '-d', name)
+    seed = git.Git(source)
+    if [name for name in gitctl.refs.branches(seed, remote=True)
+        if name.startswith('%s/' % upstream)]:
+        branches = '+refs/remotes/%s/*:refs/remotes/%s/*' % (upstream, upstream)
+    else:
+        # A mirror of the upstream
+        branches = '+refs/heads/*:refs/remotes/%s/*' % upstream
+    # The objects are already here, so this only copies the refs.
+    repository.fetch('--quiet', '--no-tags', source, branches, '+refs/tags/*:refs/tags/*')
+    # The symbolic HEAD of the remote in the seed arrives as a plain ref.
+    head = 'refs/remotes/%s/HEAD' % upstream
+    if head in [name for sha1, name in gitctl.refs.show_ref(repository)]:
+        repository.update_ref('--no-deref', '-d', head)
+    repository.remote('set-url', upstream, url)
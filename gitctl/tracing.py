@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Tracing of git invocations.
+
+When enabled with the global ``--profile`` option every git subprocess and
+GitPython call is recorded together with the project it was made for. The
+trace is written in the Chrome trace event format, which can be loaded into
+chrome://tracing or https://ui.perfetto.dev, and a summary of where the time
+went is shown at the end of the run.
+"""
+import os
+import json
+import time
+import threading
+import contextlib
+
+import git
+
+# The tracer that is currently installed, if any.
+ACTIVE = None
+
+# GitPython properties that are recorded as spans of their own.
+GITPYTHON_PROPERTIES = ('is_dirty', 'active_branch', 'branches', 'heads')
+
+_local = threading.local()
+_originals = {}
+
+class Tracer(object):
+    """Collects trace events."""
+
+    def __init__(self):
+        self.events = []
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, category, name, start, duration, **info):
+        """Records a completed event."""
+        thread = threading.current_thread()
+        event = {
+            'name' : name,
+            'cat' : category,
+            'ph' : 'X',
+            'ts' : int((start - self.started) * 1000000),
+            'dur' : int(duration * 1000000),
+            'pid' : os.getpid(),
+            'tid' : thread.name,
+            'args' : info,
+            }
+        self.lock.acquire()
+        try:
+            self.events.append(event)
+        finally:
+            self.lock.release()
+
+    def process(self, category, command, start, duration, status, output_size, cwd=None):
+        """Records a subprocess invocation."""
+        if hasattr(command, 'startswith'):
+            argv = command.split()
+        else:
+            argv = [str(arg) for arg in command]
+        # Name the event after the git command, skipping ``-c name=value``.
+        subcommand = argv[1:]
+        while len(subcommand) > 2 and subcommand[0] == '-c':
+            subcommand = subcommand[2:]
+        self.record(category, ' '.join(argv[:1] + subcommand[:1]), start, duration,
+                    project=current_project(cwd),
+                    argv=argv,
+                    status=status,
+                    output_size=output_size)
+
+    def processes(self):
+        """Returns the recorded subprocess events."""
+        return [e for e in self.events if e['cat'] in ('git', 'subprocess')]
+
+    def chrome_trace(self):
+        """Returns the trace as a Chrome trace event format document."""
+        return {'traceEvents' : sorted(self.events, key=lambda e: e['ts']),
+                'displayTimeUnit' : 'ms'}
+
+    def write(self, filename):
+        """Writes the trace into ``filename``."""
+        out = open(filename, 'w')
+        try:
+            json.dump(self.chrome_trace(), out)
+        finally:
+            out.close()
+
+    def summary(self, limit=10):
+        """Returns a textual summary of the ``limit`` most expensive calls,
+        projects and git commands.
+        """
+        calls = self.processes()
+        total = sum(e['dur'] for e in calls) / 1000000.0
+        lines = ['Profile: %d git call(s) taking %.3fs in total, %.3fs elapsed'
+                 % (len(calls), total, time.time() - self.started)]
+
+        def totals(key):
+            durations, counts = {}, {}
+            for event in calls:
+                durations[key(event)] = durations.get(key(event), 0) + event['dur']
+                counts[key(event)] = counts.get(key(event), 0) + 1
+            return sorted([(d, counts[k], k) for k, d in durations.items()], reverse=True)[:limit]
+
+        lines.append('Slowest calls:')
+        for event in sorted(calls, key=lambda e: e['dur'], reverse=True)[:limit]:
+            lines.append('  %8.3fs  %s  %s' % (event['dur'] / 1000000.0,
+                                                event['args']['project'],
+                                                ' '.join(event['args']['argv'])))
+        lines.append('Time per project:')
+        for duration, count, project in totals(lambda e: e['args']['project']):
+            lines.append('  %8.3fs  %4d call(s)  %s' % (duration / 1000000.0, count, project))
+        lines.append('Time per command:')
+        for duration, count, name in totals(lambda e: e['name']):
+            lines.append('  %8.3fs  %4d call(s)  %s' % (duration / 1000000.0, count, name))
+        lines.append('Slowest phases:')
+        phases = [e for e in self.events if e['cat'] == 'phase']
+        for event in sorted(phases, key=lambda e: e['dur'], reverse=True)[:limit]:
+            lines.append('  %8.3fs  %s' % (event['dur'] / 1000000.0, event['name']))
+        return '\n'.join(lines)
+
+def current_project(cwd=None):
+    """Returns the name of the project being processed in the current thread.
+    Falls back to the name of the working directory ``cwd``.
+    """
+    project = getattr(_local, 'project', None)
+    if project is None:
+        project = os.path.basename(cwd or os.getcwd())
+    return project
+
+@contextlib.contextmanager
+def phase(name, project=None):
+    """Records the time spent in the body of the with statement. Git calls
+    made within the phase are attributed to ``project`` if it is given.
+    """
+    previous = getattr(_local, 'project', None)
+    if project is not None:
+        _local.project = project
+    start = time.time()
+    try:
+        yield
+    finally:
+        _local.project = previous
+        if ACTIVE is not None:
+            ACTIVE.record('phase', name, start, time.time() - start, project=project)
+
+def _execute(self, command, istream=None, with_keep_cwd=False, with_extended_output=False,
+             with_exceptions=True, with_raw_output=False):
+    """Replacement for ``git.Git.execute`` that records each invocation."""
+    start = time.time()
+    status, stdout, stderr = _originals['execute'](self, command,
+        istream=istream,
+        with_keep_cwd=with_keep_cwd,
+        with_extended_output=True,
+        with_exceptions=False,
+        with_raw_output=with_raw_output)
+    if ACTIVE is not None:
+        ACTIVE.process('git', command, start, time.time() - start, status,
+                       len(stdout) + len(stderr), cwd=self.git_dir)
+
+    if with_exceptions and status != 0:
+        raise git.errors.GitCommandError(command, status, stderr)
+    if with_extended_output:
+        return (status, stdout, stderr)
+    return stdout
+
+def _traced_property(name, prop):
+    """Wraps a GitPython property so that accessing it is recorded."""
+    def getter(self):
+        start = time.time()
+        try:
+            return prop.fget(self)
+        finally:
+            if ACTIVE is not None:
+                ACTIVE.record('gitpython', 'Repo.%s' % name, start, time.time() - start,
+                              project=current_project(self.wd))
+    return property(getter, doc=prop.__doc__)
+
+def install(tracer):
+    """Starts recording git invocations into ``tracer``."""
+    global ACTIVE
+    if ACTIVE is None:
+        _originals['execute'] = git.Git.__dict__['execute']
+        git.Git.execute = _execute
+        for name in GITPYTHON_PROPERTIES:
+            _originals[name] = getattr(git.Repo, name)
+            setattr(git.Repo, name, _traced_property(name, _originals[name]))
+    ACTIVE = tracer
+
+def uninstall():
+    """Stops recording git invocations."""
+    global ACTIVE
+    if ACTIVE is not None:
+        git.Git.execute = _originals.pop('execute')
+        for name in GITPYTHON_PROPERTIES:
+            setattr(git.Repo, name, _originals.pop(name))
+    ACTIVE = None
@@ -4,16 +4,56 @@
 import re
 import os
 import sys
+import time
 import shlex
+import random
+import signal
 import logging
+import threading
 import subprocess
 
+import git
+
+import gitctl.refs
+import gitctl.locks
+import gitctl.objects
+import gitctl.tracing
+import gitctl.network
+import gitctl.maintenance
+
 from operator import itemgetter
 from StringIO import StringIO
 from ConfigParser import SafeConfigParser
 
 LOG = logging.getLogger('gitctl')
 RE_SHA1_CHECKSUM = re.compile(r'^[a-fA-F0-9]{40}$')
+RE_MISSING_REF = re.compile(r"couldn't find remote ref (\S+)")
+
+# Seconds a timed out process group is given to exit after SIGTERM before it
+# is killed with SIGKILL.
+KILL_GRACE_PERIOD = 5
+# The file in the git directory whose modification time is the time of the
+# last complete fetch of the project.
+FETCH_STAMP = 'gitctl-fetched'
+# The refs that were missing upstream are recorded in the fetch stamp and
+# not asked for again for this many seconds, as each of them costs a round
+# trip to the upstream.
+MISSING_REF_TTL = 24 * 60 * 60
+# The sparse checkout patterns in the git directory. gitctl removes the file
+# when it turns sparse checkout off, so it only exists while it is on.
+SPARSE_CHECKOUT = os.path.join('info', 'sparse-checkout')
+
+class CommandTimeout(git.errors.GitCommandError):
+    """Raised when a command does not finish in time and is killed."""
+
+    def __init__(self, command, timeout, stderr=None):
+        super(CommandTimeout, self).__init__(command, -signal.SIGTERM, stderr)
+        self.timeout = timeout
+
+    def __str__(self):
+        if not hasattr(self.command, 'startswith'):
+            return '``%s`` timed out after %ds' % (' '.join(self.command), self.timeout)
+        return '``%s`` timed out after %ds' % (self.command, self.timeout)
 
 def is_sha1(treeish):
     """Returns True if the given treeish looks like a SHA1 sum, False
@@ -36,8 +76,81 @@ def project_path(proj, relative=False):
         path = path[prefix_len:]
     return path
 
-def run(command, cwd=None):
-    """Executes the given command."""
+def _isolated(timeout):
+    """Returns True if a command with the ``timeout`` runs in a session of
+    its own, so that everything it starts can be killed with it. Without a
+    terminal nobody can answer the prompts of ssh or the credential helpers
+    anyway, but when there is one the command stays in the session of gitctl
+    so that the prompts work, and only the command itself is killed.
+    """
+    return bool(timeout) and not (sys.stdin is not None and sys.stdin.isatty())
+
+def _kill(process, group, killed):
+    """Kills ``process``, and the process group it leads if ``group`` is
+    True, politely first.
+    """
+    kill = group and os.killpg or os.kill
+    try:
+        kill(process.pid, signal.SIGTERM)
+    except OSError:
+        # Exited already
+        return
+    killed.append(True)
+    # The caller reaps the process, so only wait until it has.
+    deadline = time.time() + KILL_GRACE_PERIOD
+    while process.returncode is None and time.time() < deadline:
+        time.sleep(0.05)
+    if group or process.returncode is None:
+        # Whatever is left of the group did not take the hint.
+        try:
+            kill(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+def _start_timer(process, timeout, group, killed):
+    """Starts a timer that kills ``process``, and everything it started if
+    ``group`` is True, if it is still running after ``timeout`` seconds.
+    """
+    if not timeout:
+        return None
+    timer = threading.Timer(timeout, _kill, (process, group, killed))
+    timer.daemon = True
+    timer.start()
+    return timer
+
+def execute(command, cwd=None, timeout=None, input=None):
+    """Executes the ``command`` argument list and returns a tuple of (status,
+    stdout, stderr). If ``timeout`` is given the command is killed if it has
+    not finished in ``timeout`` seconds, raising ``CommandTimeout``, see
+    ``_isolated``.
+    """
+    start = time.time()
+    group = _isolated(timeout)
+    process = subprocess.Popen(command, cwd=cwd,
+                               stdin=input is not None and subprocess.PIPE or None,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               preexec_fn=group and os.setsid or None)
+    killed = []
+    timer = _start_timer(process, timeout, group, killed)
+    try:
+        stdout, stderr = process.communicate(input)
+    finally:
+        if timer is not None:
+            timer.cancel()
+            # Done quickly now that the command has exited
+            timer.join()
+    if gitctl.tracing.ACTIVE is not None:
+        gitctl.tracing.ACTIVE.process(command[0] == 'git' and 'git' or 'subprocess', command,
+                                      start, time.time() - start, process.returncode,
+                                      len(stdout) + len(stderr), cwd=cwd)
+    if killed:
+        raise CommandTimeout(command, timeout, stderr)
+    return process.returncode, stdout.rstrip(), stderr.rstrip()
+
+def run(command, cwd=None, timeout=None):
+    """Executes the given command. Raises ``CommandTimeout`` if ``timeout``
+    is given and the command does not finish in time.
+    """
     if hasattr(command, 'startswith'):
         # Split the command into tokens, honoring any quoted parts
         lexer = shlex.shlex(command)
@@ -47,11 +160,75 @@ def run(command, cwd=None):
     #pipe = subprocess.Popen(command, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     #retcode = pipe.wait()    
     #return retcode, pipe.stdout.read(), pipe.stderr.read()
-    return subprocess.call(' '.join(command), shell=True, cwd=cwd)
+    start = time.time()
+    group = _isolated(timeout)
+    process = subprocess.Popen(' '.join(command), shell=True, cwd=cwd,
+                               preexec_fn=group and os.setsid or None)
+    killed = []
+    timer = _start_timer(process, timeout, group, killed)
+    try:
+        retcode = process.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+            # Done quickly now that the command has exited
+            timer.join()
+    if gitctl.tracing.ACTIVE is not None:
+        # The output goes straight to the terminal so its size is unknown.
+        gitctl.tracing.ACTIVE.process('subprocess', command, start, time.time() - start,
+                                      retcode, None, cwd=cwd)
+    if killed:
+        raise CommandTimeout(' '.join(command), timeout)
+    return retcode
+
+def git_network(repository, config, *args, **kwargs):
+    """Runs a git command that talks to a remote repository in the working
+    directory of the ``git.Git`` object ``repository``.
+
+    The command is killed if it takes longer than the ``timeout`` option and
+    retried up to ``retries`` times with a randomized, exponentially growing
+    delay if it fails because of a connection problem. Accepts the
+    ``with_exceptions`` and ``with_extended_output`` keyword arguments of
+    GitPython.
+    """
+    command = ['git'] + [str(arg) for arg in args]
+    for attempt in range(config['retries'] + 1):
+        status, stdout, stderr = execute(command, cwd=repository.git_dir,
+                                         timeout=config['timeout'])
+        if (status == 0 or attempt == config['retries']
+            or not gitctl.network.is_connection_error(stderr)):
+            break
+        delay = random.uniform(0, config['retry-delay'] * 2 ** attempt)
+        LOG.debug('Retrying ``%s`` in %.1fs: %s', ' '.join(command), delay, stderr)
+        time.sleep(delay)
+
+    if kwargs.get('with_exceptions', True) and status != 0:
+        raise git.errors.GitCommandError(command, status, stderr)
+    if kwargs.get('with_extended_output', False):
+        return status, stdout, stderr
+    return stdout
+
+def report_timeouts(names, config):
+    """Logs the names of the projects whose network operations timed out."""
+    if names:
+        LOG.error('Timed out after %ds: %s', config['timeout'], ', '.join(sorted(names)))
 
 def parse_config(configs):
     """Parses the gitctl config file."""
-    parser = SafeConfigParser({'upstream' : 'origin'})
+    parser = SafeConfigParser({'upstream' : 'origin',
+                               'jobs' : '1',
+                               'auto-maintain' : 'false',
+                               'maintain-loose-objects' : '6700',
+                               'maintain-packs' : '50',
+                               'connections-per-host' : '4',
+                               'host-connections' : '',
+                               'timeout' : '600',
+                               'retries' : '2',
+                               'retry-delay' : '1.0',
+                               'lock-timeout' : '600',
+                               'fetch-all' : 'false',
+                               'fetch-tags' : 'false',
+                               'fetch-ttl' : '0'})
     if len(parser.read(configs)) == 0:
         raise ValueError('Invalid config file(s): %s' % ', '.join(configs))
     
@@ -69,6 +246,22 @@ def parse_config(configs):
             'staging-branch' : parser.get('gitctl', 'staging-branch'),
             'development-branch' : parser.get('gitctl', 'development-branch'),
             'production-branch' : parser.get('gitctl', 'production-branch'),
+            'jobs' : parser.getint('gitctl', 'jobs'),
+            'auto-maintain' : parser.getboolean('gitctl', 'auto-maintain'),
+            'maintain-loose-objects' : parser.getint('gitctl', 'maintain-loose-objects'),
+            'maintain-packs' : parser.getint('gitctl', 'maintain-packs'),
+            'connections-per-host' : parser.getint('gitctl', 'connections-per-host'),
+            'timeout' : parser.getint('gitctl', 'timeout') or None,
+            'retries' : parser.getint('gitctl', 'retries'),
+            'retry-delay' : parser.getfloat('gitctl', 'retry-delay'),
+            'lock-timeout' : parser.getint('gitctl', 'lock-timeout') or None,
+            'fetch-all' : parser.getboolean('gitctl', 'fetch-all'),
+            'fetch-tags' : parser.getboolean('gitctl', 'fetch-tags'),
+            'fetch-ttl' : parser.getint('gitctl', 'fetch-ttl'),
+            'host-connections' : dict((host.lower(), int(limit)) for host, limit
+                                      in [line.split() for line
+                                          in parser.get('gitctl', 'host-connections').splitlines()
+                                          if line.strip()]),
             }
 
 def parse_externals(config):
@@ -103,6 +296,9 @@ def parse_externals(config):
             if parser.has_option(sec, 'svn-clone-options'):
                 proj['svn-clone-options'] = parser.get(sec, 'svn-clone-options').split()
 
+        if parser.has_option(sec, 'sparse'):
+            proj['sparse'] = parser.get(sec, 'sparse').split()
+
         projects.append(proj)
     
     
@@ -114,11 +310,32 @@ def generate_externals(projects):
     for project in projects:
         print >> ext, '[%s]' % project.pop('name')
         for key, value in project.iteritems():
+            if isinstance(value, list):
+                value = ' '.join(value)
             print >> ext, '%s = %s' % (key, value)
         print >> ext
 
     return ext.getvalue().strip()
 
+def lock_file(externals):
+    """Returns the path of the lock file of the ``externals`` configuration."""
+    return os.path.splitext(externals)[0] + '.lock'
+
+def locked_revision(repository, proj, config):
+    """Returns the SHA1 of the commit the treeish of ``proj`` currently
+    resolves to in ``repository``. Branch names are resolved to the upstream
+    version of the branch.
+    """
+    if is_sha1(proj['treeish']):
+        return proj['treeish'].lower()
+    reader = gitctl.refs.refs(repository)
+    if reader.supported:
+        sha1 = reader.read('refs/remotes/%s/%s' % (config['upstream'], proj['treeish']))
+        if sha1 is not None:
+            return sha1
+    # Tags need to be peeled to the commit they point to.
+    return repository.rev_parse('--verify', '%s^{commit}' % proj['treeish']).strip()
+
 def filter_projects(projects, selection, default_all=True):
     """Returns"""
     if len(selection) == 0:
@@ -131,12 +348,271 @@ def filter_projects(projects, selection, default_all=True):
     else:
         return [p for p in projects if p['name'] in selection]
 
-def selected_projects(args, projects):
-    """Generates projects which are specified in the command line and/or from file.
+def select_projects(args, projects):
+    """Returns the list of projects which are specified in the command line and/or from file.
     args.from_file and args.project are used and should be present"""
     # if file is specified, use project names from there too.
     # but if the file is empty, do not do the command on all projects.
     projects_file_specified = args.from_file is not None
     selected_projects = set(getattr(args, 'project', [])) | set(projects_file_specified and args.from_file.read().split() or [])
-    for proj in filter_projects(projects, selected_projects, default_all=not projects_file_specified):
-        yield proj
+    return filter_projects(projects, selected_projects, default_all=not projects_file_specified)
+
+def selected_projects(args, projects):
+    """Generates projects which are specified in the command line and/or from file."""
+    for proj in select_projects(args, projects):
+        with gitctl.tracing.phase(proj['name'], project=proj['name']):
+            yield proj
+
+def state_file(args, name):
+    """Returns the path of the file ``name`` in the ``.gitctl`` directory
+    next to the externals configuration, where gitctl keeps its state.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(args.externals)), '.gitctl', name)
+
+def locked(args, config, func):
+    """Returns a wrapper of ``func(proj)`` that holds the lock of the project
+    while ``func`` runs, so that other gitctl processes do not change the
+    project at the same time. The wrapper returns False without calling
+    ``func`` if the lock is not released by another process within the
+    ``lock-timeout``.
+    """
+    def wrapper(proj):
+        lock = gitctl.locks.Lock(state_file(args, os.path.join('locks', '%s.lock' % proj['name'])),
+                                 config['lock-timeout'])
+        try:
+            lock.acquire(waiting=lambda: LOG.info('%s Waiting for another gitctl process',
+                                                  pretty(proj['name'])))
+        except gitctl.locks.LockTimeout, x:
+            LOG.error('%s ERROR %s', pretty(proj['name']), x)
+            return False
+        try:
+            return func(proj)
+        finally:
+            lock.release()
+    return wrapper
+
+def jobs(args, config):
+    """Returns the number of projects to process in parallel."""
+    return max(1, args.jobs or config['jobs'])
+
+def fetch_refspecs(proj, repository, config):
+    """Returns the refspecs that fetch the configured branches and the
+    treeish of ``proj`` from the upstream. A pinned revision is left out, see
+    ``fetch``.
+    """
+    upstream = config['upstream']
+    names = [local for remote, local in config['branches']]
+    refspecs = ['+refs/heads/%s:refs/remotes/%s/%s' % (name, upstream, name) for name in names]
+    missing = missing_refs(repository)
+    treeish = proj['treeish']
+    if not is_sha1(treeish) and treeish not in names:
+        # The treeish may be a branch or a tag. Once it has been fetched we
+        # know which one it is and do not need to ask for the other.
+        reader = gitctl.refs.refs(repository)
+        branch = '+refs/heads/%s:refs/remotes/%s/%s' % (treeish, upstream, treeish)
+        tag = '+refs/tags/%s:refs/tags/%s' % (treeish, treeish)
+        if not reader.supported:
+            refspecs.extend([branch, tag])
+        elif reader.read('refs/tags/%s' % treeish) is not None:
+            refspecs.append(tag)
+        elif reader.read('refs/remotes/%s/%s' % (upstream, treeish)) is not None:
+            refspecs.append(branch)
+        else:
+            refspecs.extend([branch, tag])
+    return [refspec for refspec in refspecs if _source(refspec) not in missing]
+
+def finish_clone(proj, repository, config):
+    """Sets up the local tracking branches of the configured branches in
+    the new clone ``repository`` of ``proj`` and checks out its treeish.
+    """
+    remote_branches = gitctl.refs.branches(repository, remote=True)
+    local_branches = gitctl.refs.branches(repository)
+    for remote, local in config['branches']:
+        if remote in remote_branches and local not in local_branches:
+            repository.branch('-f', '--track', local, remote)
+    # Before the checkout so that the rest of the tree is never written.
+    set_sparse(proj, repository)
+    repository.checkout(proj['treeish'])
+
+def sparse_patterns(repository):
+    """Returns the sparse checkout patterns of ``repository`` or None if
+    the whole tree is checked out.
+    """
+    try:
+        lines = open(os.path.join(gitctl.refs.git_dir(repository), SPARSE_CHECKOUT)).readlines()
+    except IOError:
+        return None
+    return [line.strip() for line in lines
+            if line.strip() and not line.startswith('#')]
+
+def set_sparse(proj, repository):
+    """Makes the working directory of ``repository`` match the ``sparse``
+    patterns of ``proj``, or checks out the whole tree if it has none.
+    Returns True if anything was changed.
+    """
+    patterns = proj.get('sparse') or None
+    if sparse_patterns(repository) == patterns:
+        return False
+    if patterns is not None:
+        repository.sparse_checkout('set', '--no-cone', *patterns)
+    else:
+        repository.sparse_checkout('disable')
+        os.remove(os.path.join(gitctl.refs.git_dir(repository), SPARSE_CHECKOUT))
+    return True
+
+def last_fetch(repository):
+    """Returns the time of the last complete fetch of ``repository`` or
+    None if it is not known.
+    """
+    try:
+        return os.path.getmtime(os.path.join(gitctl.refs.git_dir(repository), FETCH_STAMP))
+    except OSError:
+        return None
+
+def missing_refs(repository):
+    """Returns a mapping of the refs that were recently missing upstream in
+    the complete fetches of ``repository`` to the time they were first
+    found missing.
+    """
+    try:
+        lines = open(os.path.join(gitctl.refs.git_dir(repository), FETCH_STAMP)).read().splitlines()
+    except IOError:
+        return {}
+    missing = {}
+    for line in lines:
+        since, name = line.split(' ', 1)
+        if time.time() - float(since) < MISSING_REF_TTL:
+            missing[name] = float(since)
+    return missing
+
+def _write_fetch_stamp(repository, missing):
+    out = open(os.path.join(gitctl.refs.git_dir(repository), FETCH_STAMP), 'w')
+    try:
+        for name, since in sorted(missing.items()):
+            print >> out, '%f %s' % (since, name)
+    finally:
+        out.close()
+
+def _source(refspec):
+    return refspec.lstrip('+').split(':')[0]
+
+def is_fresh(repository, config):
+    """Returns True if ``repository`` was fetched completely within the
+    last ``fetch-ttl`` seconds, so that fetching it again can be skipped.
+    """
+    fetched = last_fetch(repository)
+    return bool(config['fetch-ttl']) and fetched is not None and \
+        time.time() - fetched < config['fetch-ttl']
+
+def _fetch(proj, repository, config, command, refspecs):
+    """Runs the fetch ``command`` for the ``refspecs``, leaving out the
+    refs that do not exist upstream. Returns the names of those refs.
+    """
+    dropped = []
+    while True:
+        status, stdout, stderr = git_network(repository, config, *(command + refspecs),
+                                             with_exceptions=False,
+                                             with_extended_output=True)
+        match = RE_MISSING_REF.search(stderr)
+        if status == 0 or match is None:
+            break
+        # Git stops at the first missing ref, so drop it and try again.
+        remaining = [refspec for refspec in refspecs if _source(refspec) != match.group(1)]
+        if not remaining or len(remaining) == len(refspecs):
+            break
+        LOG.debug('%s No ``%s`` upstream', pretty(proj['name']), match.group(1))
+        dropped.append(match.group(1))
+        refspecs = remaining
+    if status != 0:
+        raise git.errors.GitCommandError(['git'] + command + refspecs, status, stderr)
+    return dropped
+
+def fetch(proj, repository, config, refspecs=None, pin=True):
+    """Fetches the ``repository`` of ``proj`` from the upstream. If
+    automatic maintenance is enabled and the repository exceeds the
+    thresholds the maintenance is run afterwards.
+
+    Unless the ``fetch-all`` option is set only the configured branches and
+    the treeish of the project are fetched, so that the time does not depend
+    on how many branches and tags the upstream has. Branches that do not
+    exist upstream are left out. ``refspecs`` fetches only the given
+    refspecs instead.
+
+    A pinned revision that is missing locally is fetched by itself afterwards
+    unless ``pin`` is False. The upstream may not have it or may refuse to
+    fetch it by its SHA1, which is not an error as long as the branches were
+    fetched.
+
+    A complete fetch, i.e. one without ``refspecs``, is recorded for
+    ``is_fresh`` together with the refs that were missing upstream, which
+    are left out of the complete fetches for ``MISSING_REF_TTL`` seconds.
+    """
+    complete = refspecs is None
+    # Still missing as far as we know, and thus not asked for
+    missing = complete and missing_refs(repository) or {}
+    # Protocol v2 lets the server advertise only the refs we ask for.
+    command = ['-c', 'protocol.version=2', 'fetch']
+    if config['fetch-all'] and refspecs is None:
+        git_network(repository, config, *(command + [config['upstream']]))
+    else:
+        if not config['fetch-tags']:
+            command.append('--no-tags')
+        command.append(config['upstream'])
+        if refspecs is None:
+            refspecs = fetch_refspecs(proj, repository, config)
+        # Without refspecs git would fetch the configured ones instead.
+        if refspecs:
+            for name in _fetch(proj, repository, config, command, refspecs):
+                missing[name] = time.time()
+    pinned = proj['treeish'].lower()
+    if complete and pin and is_sha1(pinned) and pinned not in missing and \
+            not gitctl.objects.has_object(gitctl.refs.git_dir(repository), pinned):
+        try:
+            _fetch(proj, repository, config, command[:3] + ['--no-tags', config['upstream']],
+                   [pinned])
+        except CommandTimeout:
+            raise
+        except git.errors.GitCommandError, x:
+            LOG.debug('%s Fetching ``%s`` failed: %s', pretty(proj['name']),
+                      proj['treeish'], x.stderr)
+            missing[pinned] = time.time()
+    if complete:
+        # FETCH_HEAD is also written by partial fetches, so keep our own.
+        _write_fetch_stamp(repository, missing)
+    path = project_path(proj)
+    if config['auto-maintain'] and gitctl.maintenance.needs_maintenance(path, config):
+        # Pruning the remote branches would contact the upstream again.
+        result = gitctl.maintenance.maintain(path, config, prune=False)
+        LOG.info('%s Maintained in %.1fs, reclaimed %s', pretty(proj['name']),
+                 result['time'], gitctl.maintenance.format_size(result['reclaimed']))
+
+def prefetch_refspecs(proj, repository, config):
+    """Returns the refspecs of ``fetch`` rewritten to store the fetched refs
+    under ``refs/prefetch/`` instead.
+    """
+    if config['fetch-all']:
+        refspecs = ['+refs/heads/*:refs/remotes/%s/*' % config['upstream']]
+        if config['fetch-tags']:
+            refspecs.append('+refs/tags/*:refs/tags/*')
+    else:
+        refspecs = fetch_refspecs(proj, repository, config)
+    result = []
+    for refspec in refspecs:
+        if ':' in refspec:
+            source, destination = refspec.split(':', 1)
+            refspec = '%s:refs/prefetch/%s' % (source, destination[len('refs/'):])
+        result.append(refspec)
+    return result
+
+def prefetch(proj, repository, config):
+    """Downloads the objects ``fetch`` would for ``proj`` without changing
+    the remote branches, tags or ``FETCH_HEAD``. The fetched refs are kept
+    under ``refs/prefetch/`` so that the objects stay reachable and a later
+    fetch only needs to update the refs.
+    """
+    # An empty --refmap keeps git from also updating the remote branches
+    # the refspecs would normally map to.
+    _fetch(proj, repository, config,
+           ['-c', 'protocol.version=2', 'fetch', '--no-tags', '--no-write-fetch-head',
+            '--refmap=', config['upstream']],
+           prefetch_refspecs(proj, repository, config))
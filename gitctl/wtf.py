@@ -5,6 +5,9 @@ Morgan and contributors (see http://git-wt-commit.rubyforge.org/#git-wtf).
 """
 import re
 
+import gitctl.refs
+import gitctl.gitconfig
+
 RE_CONFIG_REMOTE_URL = re.compile(r'^remote\.([^.]+)\.url (.+)$')
 RE_CONFIG_REMOTE_BRANCH = re.compile(r'branch\.([^.]*)\.remote (.+)')
 RE_CONFIG_REMOTE_MERGE = re.compile(r'branch\.([^.]*)\.merge (?:(?:refs/)?heads/)?(.+)')
@@ -12,9 +15,29 @@ RE_CONFIG_REMOTE_MERGE = re.compile(r'branch\.([^.]*)\.merge (?:(?:refs/)?heads/
 RE_REF_LOCAL_BRANCH = re.compile(r'^heads/(.+)$')
 RE_REF_REMOTE_BRANCH = re.compile(r'^remotes/([^/]+)/(.+)$')
 
-def branch_structure(repository):
-    """Returns a dictionary containing information about the branch structure
-    in the given ``repository``.
+def tracking_config(repository):
+    """Returns a tuple of a mapping of remote names to remote URLs and a
+    mapping of branch names to their upstream tracking information read from
+    the repository configuration.
+    """
+    config = gitctl.gitconfig.repository_config(repository)
+    remote_urls = dict((name, remote.url) for name, remote in config.remotes().items()
+                       if remote.url is not None)
+
+    branches = {}
+    for name, branch in config.branches().items():
+        if branch.remote is not None:
+            branches.setdefault(name, {}).update(
+                remote=branch.remote,
+                remote_url=remote_urls.get(branch.remote, 'UNKNOWN'))
+        if branch.merge is not None:
+            branches.setdefault(name, {}).update(
+                remote_mergepoint=branch.merge_branch)
+    return remote_urls, branches
+
+def tracking_config_from_git(repository):
+    """Same as ``tracking_config`` but asks git for the configuration. Used
+    when the configuration cannot be parsed in-process.
     """
     # A mapping of remote names to remote URLs
     remote_urls = {}
@@ -31,16 +54,26 @@ def branch_structure(repository):
         if remote_match is not None:
             branches.setdefault(remote_match.group(1), {}).update(
                 remote=remote_match.group(2),
-                remote_url=remote_urls[remote_match.group(2)])
+                remote_url=remote_urls.get(remote_match.group(2), 'UNKNOWN'))
         else:
             merge_match = RE_CONFIG_REMOTE_MERGE.search(line.strip())
             if merge_match is not None:
                 branches.setdefault(merge_match.group(1), {}).update(
                     remote_mergepoint=merge_match.group(2))
+    return remote_urls, branches
+
+def branch_structure(repository):
+    """Returns a dictionary containing information about the branch structure
+    in the given ``repository``.
+    """
+    try:
+        remote_urls, branches = tracking_config(repository)
+    except gitctl.gitconfig.ConfigError:
+        remote_urls, branches = tracking_config_from_git(repository)
 
     # Add the rest of the branches
-    for line in repository.git.show_ref(with_exceptions=False).splitlines():
-        sha1, ref = [a.strip() for a in line.strip().split(' refs/')][:2]
+    for sha1, ref in gitctl.refs.show_ref(repository):
+        ref = ref[len('refs/'):]
 
         local_branch_match = RE_REF_LOCAL_BRANCH.search(ref)
         if local_branch_match is not None:
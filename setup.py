@@ -41,5 +41,6 @@ setup(name='gitctl',
       # -*- Entry points: -*-
       [console_scripts]
       gitctl = gitctl:main
+      gitctl-bench = gitctl.bench:main
       """,
       )